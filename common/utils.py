@@ -3,6 +3,14 @@ import struct
 import json
 import hashlib
 import os
+import zlib
+import asyncio
+
+# msgpack 列於 requirements.txt；未安裝時仍可運作，但只能協商出 JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 # --- Protocol Constants ---
 MSG_LOGIN_REQ = 1
@@ -16,6 +24,8 @@ MSG_GAME_UPLOAD_DATA = 11
 MSG_GAME_UPLOAD_END = 12
 MSG_GAME_REMOVE_REQ = 13 
 MSG_GAME_REMOVE_RESP = 14
+# 上傳流量控制：Server 回報已寫入的位元組數，Client 最多只能領先 window 個位元組
+MSG_GAME_UPLOAD_ACK = 15
 
 MSG_GAME_LIST_REQ = 20
 MSG_GAME_LIST_RESP = 21
@@ -23,6 +33,11 @@ MSG_GAME_DOWNLOAD_REQ = 22
 MSG_GAME_DOWNLOAD_INIT = 23
 MSG_GAME_DOWNLOAD_DATA = 24
 MSG_GAME_DOWNLOAD_END = 25
+# 分塊清單：每個分塊的 md5，Client 可用多條連線分段下載 (以 MSG_GAME_DOWNLOAD_REQ 指定 offset / length)
+MSG_GAME_MANIFEST_REQ = 26
+MSG_GAME_MANIFEST_RESP = 27
+# 差異更新封包 (zip) 內描述刪除檔案與完整檔案清單的項目名稱
+DELTA_INFO_NAME = "__delta__.json"
 
 MSG_ROOM_CREATE_REQ = 30
 MSG_ROOM_CREATE_RESP = 31
@@ -52,6 +67,9 @@ MSG_FORCE_LOGOUT = 70
 # [Spec P1] 查詢遊戲詳細資料 (含評論)
 MSG_GAME_DETAIL_REQ = 80
 MSG_GAME_DETAIL_RESP = 81
+# 分頁讀取評論：cursor 為上一頁回傳的 next_cursor，省略則從最新一則開始
+MSG_GAME_REVIEWS_REQ = 82
+MSG_GAME_REVIEWS_RESP = 83
 
 # [Spec PL1-4] Plugin 相關
 MSG_PLUGIN_LIST_REQ = 90
@@ -60,46 +78,153 @@ MSG_PLUGIN_DOWNLOAD_REQ = 92
 MSG_PLUGIN_DOWNLOAD_RESP = 93
 MSG_ROOM_CHAT = 95  # 聊天訊息封包
 
-def send_packet(sock, msg_type, payload):
+# --- Frame Flags / Capabilities ---
+# msg_type 皆小於 128，最高位元用來標記 payload 已壓縮
+FLAG_COMPRESSED = 0x80
+COMPRESS_THRESHOLD = 512      # 小於此大小的 payload 壓縮不划算，直接送出
+COMPRESS_LEVEL = 6
+# 登入時告知 Server 本端支援的壓縮演算法 (依偏好排序)
+COMPRESSION_ALGOS = ["zlib"]
+
+# 擴充封包 (Typed Frame)：msg_type byte 為 0 時，後面依序是 [真正的 msg_type][encoding]
+# 讓接收端不必猜測 payload 格式；只會送給登入時宣告支援 encodings 的對象
+MSG_EXTENDED = 0
+ENC_BYTES = 0
+ENC_JSON = 1
+ENC_MSGPACK = 2
+# 本端可使用的結構化編碼 (依偏好排序)
+SUPPORTED_ENCODINGS = (["msgpack"] if msgpack else []) + ["json"]
+# 舊格式封包中固定為 raw bytes 的訊息，不必嘗試 JSON 解析
+BINARY_MSG_TYPES = {MSG_GAME_UPLOAD_DATA, MSG_GAME_DOWNLOAD_DATA}
+
+# 單一封包本體的上限 (上傳 / 下載分塊為 256KB，其餘皆為小型 JSON)；
+# 超過代表標頭損毀或惡意的連線，直接斷線，不為它配置緩衝區
+MAX_FRAME_SIZE = 4 * 1024 * 1024
+
+# 計算整個檔案的雜湊時每次讀取的大小 (大區塊可大幅減少 read() 系統呼叫次數)
+HASH_READ_SIZE = 1024 * 1024
+
+def encode_packet(msg_type, payload, compress=False, encoding=None):
+    """
+    將訊息編碼為完整封包 bytes，格式不支援時回傳 None。
+    compress=True 時，夠大的結構化 payload 會以 zlib 壓縮並設定 FLAG_COMPRESSED。
+    encoding 為 None 時輸出舊版 '>IB' 封包；指定 "json" / "msgpack" 時輸出 Typed Frame。
+    """
+    flags = 0
+    if isinstance(payload, dict):
+        if encoding == "msgpack":
+            enc, payload_bytes = ENC_MSGPACK, msgpack.packb(payload)
+        else:
+            enc, payload_bytes = ENC_JSON, json.dumps(payload).encode('utf-8')
+        # 只壓縮結構化資料；遊戲檔案本身是 zip，再壓縮只會浪費 CPU
+        if compress and len(payload_bytes) >= COMPRESS_THRESHOLD:
+            packed = zlib.compress(payload_bytes, COMPRESS_LEVEL)
+            if len(packed) < len(payload_bytes):
+                payload_bytes = packed
+                flags = FLAG_COMPRESSED
+    elif isinstance(payload, bytes):
+        enc, payload_bytes = ENC_BYTES, payload
+    else:
+        return None
+    
+    if encoding:
+        header = struct.pack('>IBBB', 3 + len(payload_bytes), MSG_EXTENDED | flags, msg_type, enc)
+    else:
+        header = struct.pack('>IB', 1 + len(payload_bytes), msg_type | flags)
+    return header + payload_bytes
+
+def send_packet(sock, msg_type, payload, compress=False, encoding=None):
     if sock is None: return False
     try:
-        if isinstance(payload, dict):
-            payload_bytes = json.dumps(payload).encode('utf-8')
-        elif isinstance(payload, bytes):
-            payload_bytes = payload
-        else:
-            return False
-        
-        msg_len = 1 + len(payload_bytes)
-        header = struct.pack('>IB', msg_len, msg_type)
-        
-        sock.sendall(header + payload_bytes)
+        frame = encode_packet(msg_type, payload, compress, encoding)
+        if frame is None: return False
+        sock.sendall(frame)
         return True
     except Exception:
         return False
 
+def decode_payload(payload_bytes):
+    """嘗試將 payload 解析為 JSON，失敗則視為 raw bytes"""
+    try:
+        return json.loads(payload_bytes.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return payload_bytes
+
+def decode_frame(body):
+    """解析封包本體 (msg_type byte + payload)，處理壓縮旗標與 Typed Frame"""
+    msg_type = body[0] & ~FLAG_COMPRESSED
+    if msg_type == MSG_EXTENDED:
+        msg_type, enc = body[1], body[2]
+        payload_bytes = bytes(body[3:])
+    else:
+        enc = None
+        payload_bytes = bytes(body[1:])
+    if body[0] & FLAG_COMPRESSED:
+        payload_bytes = zlib.decompress(payload_bytes)
+
+    if enc == ENC_BYTES:
+        return msg_type, payload_bytes
+    if enc == ENC_JSON:
+        return msg_type, json.loads(payload_bytes.decode('utf-8'))
+    if enc == ENC_MSGPACK:
+        if msgpack is None: raise ValueError("msgpack frame received but msgpack is not installed")
+        # strict_map_key=False：允許以 int 為 key 的 dict (例如 {room_id: ...})
+        return msg_type, msgpack.unpackb(payload_bytes, raw=False, strict_map_key=False)
+    # 舊版封包：依訊息種類或內容判斷格式
+    if msg_type in BINARY_MSG_TYPES:
+        return msg_type, payload_bytes
+    return msg_type, decode_payload(payload_bytes)
+
 def recv_packet(sock):
     try:
         raw_len = recv_all(sock, 4)
         if not raw_len: return None, None
         
         msg_len = struct.unpack('>I', raw_len)[0]
+        if not 1 <= msg_len <= MAX_FRAME_SIZE: return None, None
         data = recv_all(sock, msg_len)
         if not data: return None, None
         
-        msg_type = data[0]
-        payload_bytes = data[1:]
-        
-        try:
-            payload = json.loads(payload_bytes.decode('utf-8'))
-        except (UnicodeDecodeError, json.JSONDecodeError):
-            payload = payload_bytes
-            
-        return msg_type, payload
+        return decode_frame(data)
         
     except Exception:
         return None, None
 
+def parse_frames(buffer):
+    """
+    從接收緩衝區 (bytearray) 取出所有完整的 '>IB' 封包。
+    回傳 [(msg_type, payload), ...]，不完整的封包保留在 buffer 中等待後續資料。
+    """
+    frames = []
+    pos = 0
+    total = len(buffer)
+    view = memoryview(buffer)
+    try:
+        while total - pos >= 4:
+            msg_len = struct.unpack_from('>I', buffer, pos)[0]
+            if not 1 <= msg_len <= MAX_FRAME_SIZE:
+                raise ValueError(f"Invalid frame length {msg_len}")
+            if total - pos - 4 < msg_len: break
+            start = pos + 4
+            frames.append(decode_frame(view[start:start + msg_len]))
+            pos = start + msg_len
+    finally:
+        # 必須先釋放 memoryview，bytearray 才能縮減
+        view.release()
+    if pos: del buffer[:pos]
+    return frames
+
+# --- asyncio 版本 (供 asyncio 模式的 Server 使用) ---
+async def async_recv_packet(reader):
+    try:
+        raw_len = await reader.readexactly(4)
+        msg_len = struct.unpack('>I', raw_len)[0]
+        if not 1 <= msg_len <= MAX_FRAME_SIZE: return None, None
+        data = await reader.readexactly(msg_len)
+        return decode_frame(data)
+    except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError, zlib.error):
+        return None, None
+
 def recv_all(sock, n):
     data = b''
     while len(data) < n:
@@ -111,12 +236,25 @@ def recv_all(sock, n):
             return None
     return data
 
-def calculate_checksum(filepath):
-    hash_md5 = hashlib.md5()
+def calculate_checksum(filepath, algo="md5"):
+    hash_md5 = hashlib.new(algo)
     try:
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
+        buf = bytearray(HASH_READ_SIZE)
+        view = memoryview(buf)
+        with open(filepath, "rb", buffering=0) as f:
+            # readinto 重複使用同一塊緩衝區，不必每次配置新的 bytes
+            for n in iter(lambda: f.readinto(buf), 0):
+                hash_md5.update(view[:n])
         return hash_md5.hexdigest()
     except:
-        return ""
\ No newline at end of file
+        return ""
+
+def calculate_crc32(filepath):
+    """計算檔案的 CRC-32 (與 zip 內每個項目記錄的 CRC 相同)，用來驗證差異更新後的檔案"""
+    crc = 0
+    buf = bytearray(HASH_READ_SIZE)
+    view = memoryview(buf)
+    with open(filepath, "rb", buffering=0) as f:
+        for n in iter(lambda: f.readinto(buf), 0):
+            crc = zlib.crc32(view[:n], crc)
+    return crc
\ No newline at end of file
@@ -15,10 +15,13 @@ except ImportError:
     def recv_packet(s): return None, {}
     def calculate_checksum(f): return "dummy"
     MSG_LOGIN_REQ = 1; MSG_GAME_UPLOAD_INIT = 10; MSG_GAME_UPLOAD_DATA = 11; MSG_GAME_UPLOAD_END = 12
+    MSG_GAME_UPLOAD_ACK = 15
+    COMPRESSION_ALGOS = []; SUPPORTED_ENCODINGS = []
 
 # [Config] Default
 HOST = '140.113.17.11'
 PORT = 12365
+UPLOAD_MAX_RETRIES = 3   # 上傳中斷後自動重連續傳的次數
 
 # ==========================================
 #  Developer Client Logic
@@ -34,6 +37,7 @@ class DeveloperClient:
         if not os.path.exists(self.base_workspace):
             os.makedirs(self.base_workspace)
         self.current_user_dir = None
+        self.credentials = None   # (username, password)，斷線續傳時自動重新登入用
 
     def _clear_screen(self):
         os.system('cls' if os.name == 'nt' else 'clear')
@@ -80,6 +84,7 @@ class DeveloperClient:
             if msg_type == MSG_FORCE_LOGOUT:
                 print(f"\n\n[!] Alert: {data.get('msg', 'Logged out by server')}")
                 print("[*] Returning to Auth Menu...")
+                self.credentials = None   # 被踢除時不可自動重新登入
                 self._handle_disconnect()
                 return None, None # 中斷後續邏輯
                 
@@ -124,8 +129,7 @@ class DeveloperClient:
         if choice == '1':
             user = input("Username: ")
             pwd = input("Password: ")
-            send_packet(self.sock, MSG_LOGIN_REQ, {"username": user, "password": pwd, "role": "developer"})
-            msg_type, resp = self._safe_recv()
+            resp = self._login(user, pwd)
             if resp and resp.get("status") == "ok": # 記得檢查 resp 是否存在
                 self.handle_login_success(user)
             else:
@@ -145,6 +149,29 @@ class DeveloperClient:
         elif choice == '3':
             self.running = False
 
+    def _login(self, user, pwd):
+        """送出登入請求並回傳 Server 回應 (連線中斷時為 None)"""
+        send_packet(self.sock, MSG_LOGIN_REQ, {
+            "username": user, "password": pwd, "role": "developer",
+            "caps": {"compress": COMPRESSION_ALGOS, "encodings": SUPPORTED_ENCODINGS}
+        })
+        msg_type, resp = self._safe_recv()
+        if resp and resp.get("status") == "ok":
+            self.credentials = (user, pwd)
+        return resp
+
+    def _reconnect(self):
+        """重新連線並用保留的帳密自動登入，不離開目前的畫面"""
+        if not self.credentials: return False
+        if not self.connect(): return False
+        resp = self._login(*self.credentials)
+        if not resp or resp.get("status") != "ok": return False
+        user = self.credentials[0]
+        self.username = user
+        self.is_logged_in = True
+        self.current_user_dir = os.path.join(self.base_workspace, user)
+        return True
+
     def handle_login_success(self, user):
         self.username = user
         self.is_logged_in = True
@@ -173,6 +200,7 @@ class DeveloperClient:
         elif choice == '6':
             print("[*] Logging out...")
             # 主動登出只需切斷本地狀態，Server 會處理斷線
+            self.credentials = None
             self._handle_disconnect()
 
     def fetch_my_games(self):
@@ -354,11 +382,20 @@ class DeveloperClient:
             
             if resp:
                 print(f"\n=== Reviews for {name} ===")
-                print(f"Avg Score: {resp.get('avg_score', 0)}")
+                print(f"Avg Score: {resp.get('avg_score', 0)} ({resp.get('review_count', len(resp.get('reviews', [])))} reviews)")
                 reviews = resp.get('reviews', [])
                 if not reviews: print("No reviews.")
                 for r in reviews:
                     print(f"- {r['user']}: {r['comment']} ({r['score']}/5)")
+                # 詳細資料只附最新幾則，更舊的評論逐頁讀取
+                cursor = resp.get('next_cursor')
+                while cursor and input("-- Load older reviews? (y/n): ").strip().lower() == 'y':
+                    send_packet(self.sock, MSG_GAME_REVIEWS_REQ, {"game_name": name, "cursor": cursor, "limit": 20})
+                    msg_type, page = self._safe_recv()
+                    if not page or page.get("status") != "ok": break
+                    for r in page.get('reviews', []):
+                        print(f"- {r['user']}: {r['comment']} ({r['score']}/5)")
+                    cursor = page.get('next_cursor')
             else:
                 print("[-] Connection Error.")
         except: pass
@@ -370,44 +407,85 @@ class DeveloperClient:
         try:
             sz = os.path.getsize(zip_base+".zip")
             ck = calculate_checksum(zip_base+".zip")
-            send_packet(self.sock, MSG_GAME_UPLOAD_INIT, {
+            init_req = {
                 "name": name, "version": version, "size": sz, "checksum": ck,
                 "description": m.get("description", ""),
                 "type": m.get("type", "CLI"),
                 "min_players": m.get("min_players", 2),
-                "max_players": m.get("max_players", 4)
-            })
-            msg_type, init_resp = self._safe_recv()
-            if init_resp and init_resp.get("status") == "ready":
-                print("[*] Uploading data...")
-                
-                with open(zip_base+".zip", 'rb') as f:
-                    while True:
-                        c = f.read(4096)
-                        if not c: break
-                        send_packet(self.sock, MSG_GAME_UPLOAD_DATA, c)
-                        time.sleep(0.005)
-                
-                send_packet(self.sock, MSG_GAME_UPLOAD_END, {})
-                
-                # [Fix] 再次使用 _safe_recv 接收結果
-                msg_type, res = self._safe_recv()
-                if res:
-                    print(f"[+] Result: {res.get('status')} - {res.get('msg', '')}")
-                else:
-                    print("[-] Upload finished but connection lost (or logged out).")
-            else:
-                # 若 init_resp 為 None，代表連線錯誤
-                if init_resp is None:
-                     print("[-] Connection Error: No response from server.")
-                else:
-                     msg = init_resp.get('msg', 'Unknown Error')
-                     print(f"[-] Server rejected upload: {msg}")
+                "max_players": m.get("max_players", 4),
+                "flow_control": True,
+                "resume": True   # Server 保留著同一份檔案的未完成上傳時，從中斷處接續
+            }
+            # 連線中斷時自動重連、重新登入並續傳；zip 保留到整個流程結束
+            for attempt in range(UPLOAD_MAX_RETRIES + 1):
+                if attempt:
+                    print(f"[*] Connection lost. Resuming upload ({attempt}/{UPLOAD_MAX_RETRIES})...")
+                    time.sleep(1)
+                    if not self._reconnect(): continue
+                if self._upload_attempt(zip_base+".zip", sz, init_req) is not None: return
+            print("[-] Upload failed: connection lost.")
         except Exception as e:
             print(f"[!] Upload Exception: {e}")
         finally:
             if os.path.exists(zip_base+".zip"): os.remove(zip_base+".zip")
 
+    def _upload_attempt(self, zip_path, size, init_req):
+        """進行一次上傳 (可能是續傳)。連線中斷回傳 None，否則回傳 Server 是否接受"""
+        send_packet(self.sock, MSG_GAME_UPLOAD_INIT, init_req)
+        msg_type, init_resp = self._safe_recv()
+        if init_resp is None: return None
+        if init_resp.get("status") != "ready":
+            print(f"[-] Server rejected upload: {init_resp.get('msg', 'Unknown Error')}")
+            return False
+
+        if init_resp.get("offset"):
+            print(f"[*] Resuming upload from {init_resp['offset']}/{size} bytes...")
+        else:
+            print("[*] Uploading data...")
+        if not self._send_upload_data(zip_path, size, init_resp):
+            print()
+            return None
+        send_packet(self.sock, MSG_GAME_UPLOAD_END, {})
+
+        # [Fix] 再次使用 _safe_recv 接收結果 (略過尚在途中的 ACK)
+        msg_type, res = self._safe_recv()
+        while msg_type == MSG_GAME_UPLOAD_ACK:
+            msg_type, res = self._safe_recv()
+        if res is None: return None
+        print(f"[+] Result: {res.get('status')} - {res.get('msg', '')}")
+        return res.get("status") == "ok"
+
+    def _send_upload_data(self, zip_path, size, init_resp):
+        """
+        依 Server 給的 window 送出檔案：未被 ACK 的位元組達到 window 時才停下來等 ACK，
+        否則以大封包連續送出。舊版 Server 不提供 window，沿用小封包 + 間隔的送法。
+        """
+        window = init_resp.get("window")
+        offset = init_resp.get("offset", 0)
+        if not window:
+            with open(zip_path, 'rb') as f:
+                f.seek(offset)
+                for c in iter(lambda: f.read(4096), b""):
+                    if not send_packet(self.sock, MSG_GAME_UPLOAD_DATA, c): return False
+                    time.sleep(0.005)
+            return True
+
+        chunk_size = min(init_resp.get("chunk_size", 65536), window)
+        sent = acked = offset
+        with open(zip_path, 'rb') as f:
+            f.seek(offset)
+            for c in iter(lambda: f.read(chunk_size), b""):
+                while sent + len(c) - acked > window:
+                    msg_type, ack = self._safe_recv()
+                    if msg_type != MSG_GAME_UPLOAD_ACK: return False
+                    acked = ack["received"]
+                    window = ack.get("window", window)
+                if not send_packet(self.sock, MSG_GAME_UPLOAD_DATA, c): return False
+                sent += len(c)
+                print(f"\r[*] Sent {sent * 100 // max(size, 1)}% ({sent}/{size} bytes)", end="", flush=True)
+        print()
+        return True
+
 # ==========================================
 #  [Level A] CLI Rock-Paper-Scissors (RPS)
 # ==========================================
@@ -5,10 +5,12 @@ import os
 import time
 import queue
 import zipfile
+import shutil
 import subprocess
 import json
 import importlib
 import struct
+import hashlib
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from common.utils import *
@@ -18,6 +20,11 @@ from common.utils import *
 # ==========================================
 HOST = '140.113.17.11'
 PORT = 12365
+DOWNLOAD_MAX_RETRIES = 3   # 下載中斷後自動重連續傳的次數
+DOWNLOAD_CONNECTIONS = 4   # 依分塊清單下載時同時開啟的連線數
+PARALLEL_MIN_CHUNKS = 2    # 分塊數達到此數量才值得平行下載
+CHUNK_MAX_RETRIES = 3      # 單一分塊斷線或驗證失敗時最多重抓幾次
+CHUNK_TIMEOUT = 10         # 分塊下載連線的逾時秒數
 
 # States
 STATE_DISCONNECTED = 0
@@ -39,6 +46,7 @@ class LobbyClient:
         self.running = True # 控制整個程式是否結束
         self.connected = False # 控制當前連線是否有效
         self.username = None
+        self.credentials = None # 登入成功後保留帳密，供斷線後自動重登續傳
         self.recv_thread = None
         self.server_port = PORT
         
@@ -53,6 +61,7 @@ class LobbyClient:
         self.last_response = None
         self.download_complete_event = threading.Event()
         self.download_state = None 
+        self.download_ok = False
 
         # Plugin System
         self.active_chat_plugin = None
@@ -106,6 +115,7 @@ class LobbyClient:
                         self.clear_line()
                         print("\n[!] Disconnected from server.")
                         self.connected = False
+                        self._abort_download()
                         self.response_event.set() # 解除可能卡住的 wait
                         self.download_complete_event.set()
                     break
@@ -119,10 +129,14 @@ class LobbyClient:
                 if self.connected and self.running:
                     print("\n[!] Connection lost.")
                     self.connected = False
+                self._abort_download()
+                self.download_complete_event.set()
                 break
             except Exception as e:
                 print(f"[!] Network Error: {e}")
                 self.connected = False
+                self._abort_download()
+                self.download_complete_event.set()
                 break
 
     def reset_req(self):
@@ -160,7 +174,10 @@ class LobbyClient:
             print("[*] Press Enter to return to Login...")
             self.connected = False # 這會終止 network_loop
             self.username = None
+            self.credentials = None # 被踢下線時不自動重登
+            self._abort_download()
             self.response_event.set()
+            self.download_complete_event.set()
             # 強制關閉 socket 以中斷 recv
             try: self.sock.close()
             except: pass
@@ -258,7 +275,7 @@ class LobbyClient:
             print(f"\n[*] GAME LAUNCH! Connect to {data['server_ip']}:{data['port']}")
             self.launch_game_client(data)
             
-        elif msg_type == MSG_GAME_DETAIL_RESP:
+        elif msg_type in [MSG_GAME_DETAIL_RESP, MSG_GAME_REVIEWS_RESP, MSG_GAME_MANIFEST_RESP]:
             self.last_response = data
             self.response_event.set()
 
@@ -279,33 +296,105 @@ class LobbyClient:
         save_dir = os.path.join("downloads", self.username, game_name)
         if not os.path.exists(save_dir): os.makedirs(save_dir)
         zip_path = os.path.join(save_dir, "game.zip")
+        offset = data.get("offset", 0)
+        
+        if data.get("delta_from"):
+            # 差異更新檔很小，不做續傳，也不留續傳用的 .json
+            zip_path = os.path.join(save_dir, "update.zip")
+            f = open(zip_path, "wb")
+        elif offset:
+            # Server 同意續傳：接在既有的部分檔案後面
+            f = open(zip_path, "ab")
+            f.truncate(offset)
+        else:
+            f = open(zip_path, "wb")
+            # 記錄這份部分檔案對應的版本，斷線後才能向 Server 要求續傳
+            with open(zip_path + ".json", "w") as meta_f:
+                json.dump({"version": data["version"], "checksum": data["checksum"]}, meta_f)
         
         self.download_state = {
-            "f": open(zip_path, "wb"), "path": zip_path, "dir": save_dir,
+            "f": f, "path": zip_path, "dir": save_dir,
             "size": data["size"], "expected_checksum": data["checksum"],
-            "received": 0, "name": game_name, "start_time": time.time()
+            "received": offset, "name": game_name, "start_time": time.time(),
+            "delta_from": data.get("delta_from")
         }
+        self.download_ok = False
         self.download_complete_event.clear()
 
+    def _abort_download(self):
+        """連線中斷時關閉下載檔案，保留已收到的部分供續傳"""
+        state = self.download_state
+        if not state: return
+        try: state["f"].close()
+        except: pass
+        self.download_state = None
+
+    def _get_partial_download(self, game_name):
+        """回傳續傳所需的 offset / version / checksum，沒有部分檔案時回傳空 dict"""
+        zip_path = os.path.join("downloads", self.username, game_name, "game.zip")
+        try:
+            with open(zip_path + ".json", "r") as f: meta = json.load(f)
+            return {"offset": os.path.getsize(zip_path), "version": meta["version"], "checksum": meta["checksum"]}
+        except (OSError, ValueError, KeyError):
+            return {}
 
     def finish_download(self):
         state = self.download_state
-        state["f"].close()
+        if state["f"]: state["f"].close()
         self.clear_line()
         print(f"[*] Download finished. Verifying...")
         
         cal_sum = calculate_checksum(state["path"])
-        if cal_sum == state["expected_checksum"]:
+        if cal_sum == state["expected_checksum"] and state["delta_from"]:
+            try:
+                self._apply_delta(state)
+                print(f"[+] Game updated: {state['name']} (from v{state['delta_from']})")
+                self.download_ok = True
+            except Exception as e:
+                print(f"[-] Delta update failed: {e}")
+        elif cal_sum == state["expected_checksum"]:
             try:
                 with zipfile.ZipFile(state["path"], 'r') as zip_ref:
                     zip_ref.extractall(state["dir"])
                 print(f"[+] Game installed: {state['name']}")
-                os.remove(state["path"])
+                self.download_ok = True
             except Exception as e:
                 print(f"[-] Extraction failed: {e}")
         else:
             print(f"[-] Checksum Mismatch!")
+        # 不論成功與否都清掉部分檔案，下次從頭下載
+        for path in (state["path"], state["path"] + ".json"):
+            if os.path.exists(path): os.remove(path)
         self.download_state = None
+
+    def _apply_delta(self, state):
+        """
+        在安裝目錄的 staging 複本上套用差異檔：刪除舊檔、寫入變動的檔案，
+        再以 CRC 驗證新版本的每個檔案，全部正確才替換安裝目錄；失敗時原本的安裝不受影響。
+        """
+        game_dir = state["dir"]
+        staging, backup = game_dir + ".staging", game_dir + ".old"
+        for d in (staging, backup):
+            if os.path.exists(d): shutil.rmtree(d)
+        shutil.copytree(game_dir, staging, ignore=shutil.ignore_patterns("game.zip*", "update.zip"))
+        try:
+            root = os.path.realpath(staging)
+            with zipfile.ZipFile(state["path"], 'r') as z:
+                info = json.loads(z.read(DELTA_INFO_NAME))
+                for name in info["removed"]:
+                    p = os.path.realpath(os.path.join(staging, name))
+                    if p.startswith(root + os.sep) and os.path.isfile(p): os.remove(p)
+                for name in z.namelist():
+                    if name != DELTA_INFO_NAME: z.extract(name, staging)
+            for name, crc in info["files"].items():
+                p = os.path.join(staging, name)
+                if not os.path.isfile(p) or calculate_crc32(p) != crc:
+                    raise ValueError(f"verification failed: {name}")
+            os.rename(game_dir, backup)
+            os.rename(staging, game_dir)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            shutil.rmtree(backup, ignore_errors=True)
    
     def _get_local_version(self, game_name):
         manifest_path = os.path.join("downloads", self.username, game_name, "manifest.json")
@@ -427,18 +516,182 @@ class LobbyClient:
             self.state = STATE_IN_ROOM
 
     # 出下載邏輯，供 Store 和 Create Room 共用
-    def _download_helper(self, game_name):
+    # 連線中斷時會自動重連、重新登入，並從已收到的位置續傳
+    # 已安裝舊版本時先嘗試差異更新，套用失敗則改下載完整檔案
+    def _download_helper(self, game_name, use_delta=True):
+        for attempt in range(DOWNLOAD_MAX_RETRIES + 1):
+            if attempt:
+                print(f"[*] Connection lost. Resuming download ({attempt}/{DOWNLOAD_MAX_RETRIES})...")
+                time.sleep(1)
+                # 分塊下載的連線中斷時，主連線可能仍然正常，不必重新登入
+                if not self.connected and not self._reconnect(): continue
+
+            req = {"game_name": game_name}
+            req.update(self._get_partial_download(game_name))
+            local_ver = self._get_local_version(game_name) if use_delta else None
+            # 沒有差異檔可用且檔案夠大時，改依分塊清單以多條連線下載
+            manifest = self._request_manifest(game_name, local_ver)
+            if manifest and not manifest.get("delta_size") and len(manifest["chunks"]) >= PARALLEL_MIN_CHUNKS:
+                ok = self._parallel_download(manifest)
+                if ok is not None: return ok
+                continue   # 分塊下載中斷：下一輪重新取得清單，已驗證的分塊不會重抓
+            if local_ver and "offset" not in req: req["installed_version"] = local_ver
+            self.reset_req()
+            self.download_complete_event.clear()
+            if not send_packet(self.sock, MSG_GAME_DOWNLOAD_REQ, req): continue
+            resp = self.wait_for_response()
+            
+            if resp.get("status") != "ok":
+                if not self.connected: continue
+                print(f"[-] Download failed: {resp.get('msg')}")
+                return False
+
+            if resp.get("delta_from"):
+                print(f"[*] Updating {game_name} v{resp['delta_from']} -> v{resp['version']} ({resp['size']} bytes)...")
+            elif resp.get("offset"):
+                print(f"[*] Resuming {game_name} from {resp['offset']}/{resp['size']} bytes...")
+            else:
+                print(f"[*] Downloading {game_name}...")
+            self.download_complete_event.wait()
+            if self.connected:
+                if not self.download_ok and resp.get("delta_from"):
+                    print("[*] Falling back to full download...")
+                    return self._download_helper(game_name, use_delta=False)
+                return self.download_ok
+
+        print("[-] Download failed: connection lost.")
+        return False
+
+    def _request_manifest(self, game_name, local_ver):
+        """取得最新版本的分塊清單；舊版 Server 不支援或發生錯誤時回傳 None"""
+        req = {"game_name": game_name}
+        if local_ver: req["installed_version"] = local_ver
         self.reset_req()
-        send_packet(self.sock, MSG_GAME_DOWNLOAD_REQ, {"game_name": game_name})
+        if not send_packet(self.sock, MSG_GAME_MANIFEST_REQ, req): return None
+        resp = self.wait_for_response()
+        return resp if resp.get("status") == "ok" and resp.get("chunks") else None
+
+    def _parallel_download(self, m):
+        """
+        依分塊清單以多條連線同時下載，每個分塊收到後立即以 md5 驗證，錯誤的分塊單獨重抓。
+        已有 game.zip 時 (上次的分塊下載，或單一連線下載留下的較短檔案) 先逐塊比對已涵蓋的部分，
+        只下載缺少或損壞的分塊 (斷線續傳)。
+        回傳 True / False 表示結果；連線中斷等可重試的失敗回傳 None，由 _download_helper 重試。
+        """
+        save_dir = os.path.join("downloads", self.username, m["game_name"])
+        if not os.path.exists(save_dir): os.makedirs(save_dir)
+        zip_path = os.path.join(save_dir, "game.zip")
+        size, chunk_size = m["size"], m["chunk_size"]
+
+        pending = queue.Queue()
+        existing = os.path.getsize(zip_path) if os.path.exists(zip_path) else 0
+        with open(zip_path, "r+b" if existing else "wb") as f:
+            f.truncate(size)
+            for i, h in enumerate(m["chunks"]):
+                # 只比對完整落在原有內容內的分塊，補零的部分一定要下載
+                if min((i + 1) * chunk_size, size) <= existing:
+                    f.seek(i * chunk_size)
+                    if hashlib.md5(f.read(chunk_size)).hexdigest() == h: continue
+                pending.put(i)
+        # 檔案已補到完整大小，單一連線續傳的 offset 紀錄不再正確
+        if os.path.exists(zip_path + ".json"): os.remove(zip_path + ".json")
+
+        total = pending.qsize()
+        if total < len(m["chunks"]):
+            print(f"[*] Resuming {m['game_name']}: {len(m['chunks']) - total}/{len(m['chunks'])} chunks already verified")
+        print(f"[*] Downloading {m['game_name']} ({size} bytes) using {min(DOWNLOAD_CONNECTIONS, total)} connection(s)...")
+        job = {"m": m, "path": zip_path, "pending": pending, "tries": {},
+               "done": 0, "total": total, "error": None, "lock": threading.Lock()}
+        workers = [threading.Thread(target=self._chunk_worker, args=(job,), daemon=True)
+                   for _ in range(min(DOWNLOAD_CONNECTIONS, total))]
+        for t in workers: t.start()
+        for t in workers: t.join()
+        if total: print()
+        if job["error"] or job["done"] < total:
+            print(f"[-] Chunk download interrupted: {job['error'] or 'connection lost'}")
+            return None
+
+        # 各分塊都已驗證，交給 finish_download 做整體 checksum 與解壓縮
+        self.download_state = {
+            "f": None, "path": zip_path, "dir": save_dir, "expected_checksum": m["checksum"],
+            "name": m["game_name"], "delta_from": None
+        }
+        self.download_ok = False
+        self.finish_download()
+        return self.download_ok
+
+    def _chunk_worker(self, job):
+        """分塊下載執行緒：使用自己的連線，從佇列取分塊直到下載完畢"""
+        m, pending = job["m"], job["pending"]
+        s = None
+        with open(job["path"], "r+b") as f:
+            while not job["error"]:
+                try: i = pending.get_nowait()
+                except queue.Empty: break
+                offset = i * m["chunk_size"]
+                length = min(m["chunk_size"], m["size"] - offset)
+                try:
+                    if s is None: s = socket.create_connection((HOST, self.server_port), timeout=CHUNK_TIMEOUT)
+                    data = self._fetch_range(s, m, offset, length)
+                except OSError:
+                    data = None
+                if isinstance(data, str):
+                    # Server 拒絕 (例如下載途中版本被更新)，重試也沒有用
+                    job["error"] = data
+                    break
+                if data is not None and hashlib.md5(data).hexdigest() == m["chunks"][i]:
+                    f.seek(offset)
+                    f.write(data)
+                    with job["lock"]:
+                        job["done"] += 1
+                        print(f"\r[*] Chunks {job['done']}/{job['total']}", end="", flush=True)
+                    continue
+                # 斷線或內容不符：換一條新連線重抓這一塊
+                if s: s.close(); s = None
+                with job["lock"]:
+                    job["tries"][i] = job["tries"].get(i, 0) + 1
+                    if job["tries"][i] > CHUNK_MAX_RETRIES:
+                        job["error"] = f"chunk {i} failed after {CHUNK_MAX_RETRIES} retries"
+                        break
+                pending.put(i)
+        if s: s.close()
+
+    def _fetch_range(self, s, m, offset, length):
+        """下載一個分塊並回傳 bytes；Server 拒絕時回傳錯誤訊息字串，斷線時回傳 None"""
+        req = {"game_name": m["game_name"], "version": m["version"], "checksum": m["checksum"],
+               "offset": offset, "length": length}
+        if not send_packet(s, MSG_GAME_DOWNLOAD_REQ, req): return None
+        msg_type, init = recv_packet(s)
+        if msg_type != MSG_GAME_DOWNLOAD_INIT: return None
+        if init.get("status") != "ok": return init.get("msg", "Download rejected")
+        buf = bytearray()
+        while True:
+            msg_type, payload = recv_packet(s)
+            if msg_type == MSG_GAME_DOWNLOAD_DATA: buf += payload
+            elif msg_type == MSG_GAME_DOWNLOAD_END: return bytes(buf)
+            else: return None
+
+    def _login(self, user, pwd):
+        self.reset_req()
+        # caps: 告知 Server 本端可解的壓縮與編碼格式，Server 會據此選擇回應封包的格式
+        caps = {"compress": COMPRESSION_ALGOS, "encodings": SUPPORTED_ENCODINGS}
+        login_req = {"username": user, "password": pwd, "role": "player", "caps": caps}
+        if not send_packet(self.sock, MSG_LOGIN_REQ, login_req):
+            return {"status": "error", "msg": "Connection Error"}
         resp = self.wait_for_response()
-        
         if resp.get("status") == "ok":
-            print(f"[*] Downloading {game_name}...")
-            self.download_complete_event.wait()
-            return True
-        else:
-            print(f"[-] Download failed: {resp.get('msg')}")
-            return False
+            self.username = user
+            self.credentials = (user, pwd)
+        return resp
+
+    def _reconnect(self):
+        """重新連線並用保留的帳密自動登入，維持原本的畫面狀態"""
+        if not self.credentials: return False
+        prev_state = self.state
+        if not self.connect(): return False
+        if self._login(*self.credentials).get("status") != "ok": return False
+        self.state = prev_state
+        return True
 
     # Plugin Helpers
     # Plugin Management
@@ -526,14 +779,11 @@ class LobbyClient:
         if choice == '1':
             user = input("Username: ")
             pwd = input("Password: ")
-            self.reset_req()
-            if send_packet(self.sock, MSG_LOGIN_REQ, {"username": user, "password": pwd, "role": "player"}):
-                resp = self.wait_for_response()
-                if resp.get("status") == "ok":
-                    self.username = user
-                    print(f"[+] Welcome {user}!")
-                else:
-                    print(f"[-] Failed: {resp.get('msg')}")
+            resp = self._login(user, pwd)
+            if resp.get("status") == "ok":
+                print(f"[+] Welcome {user}!")
+            else:
+                print(f"[-] Failed: {resp.get('msg')}")
         elif choice == '2':
             user = input("New User: ")
             pwd = input("New Pass: ")
@@ -555,7 +805,7 @@ class LobbyClient:
             time.sleep(0.1) 
         elif c == '2': self.state = STATE_STORE
         elif c == '3': self.state = STATE_PLUGIN
-        elif c == '4': self.state = STATE_AUTH_MENU; self.username = None
+        elif c == '4': self.state = STATE_AUTH_MENU; self.username = None; self.credentials = None
 
     def store_menu(self):
         while self.connected:
@@ -660,7 +910,7 @@ class LobbyClient:
         print(f"Author:      {resp.get('owner', 'Unknown')}")
         print(f"Type:        {resp.get('type', 'CLI')}")
         print(f"Players:     {resp.get('min_players')}-{resp.get('max_players')}")
-        print(f"Rating:      {resp.get('avg_score', 'N/A')} / 5.0")
+        print(f"Rating:      {resp.get('avg_score', 'N/A')} / 5.0 ({resp.get('review_count', len(resp.get('reviews', [])))} reviews)")
         print(f"Status:      {install_status}") # [UX Fix] 明確告知版本狀態
         print(f"Played:      {'Yes' if resp.get('has_played') else 'No'}")
         print("-" * 40)
@@ -675,20 +925,17 @@ class LobbyClient:
                 print(f"  [{r['score']}/5] {r['user']}: {r['comment']}")
         print("=" * 40)
 
-        print("\n[Options] 1. Download Game  2. Rate Game  3. Back")
+        review_cursor = resp.get("next_cursor")
+        if review_cursor:
+            print("\n[Options] 1. Download Game  2. Rate Game  3. Back  4. Older Reviews")
+        else:
+            print("\n[Options] 1. Download Game  2. Rate Game  3. Back")
         act = input("Select: ")
         
         if act == '1': # 下載
-            self.response_event.clear()
-            self.download_complete_event.clear()
-            send_packet(self.sock, MSG_GAME_DOWNLOAD_REQ, {"game_name": game_name})
-            d_resp = self.wait_for_response()
-            if d_resp.get("status") == "ok":
-                print(f"[*] Downloading {game_name}...")
-                self.download_complete_event.wait()
+            if self._download_helper(game_name):
                 input("\n[Done] Press Enter...")
             else:
-                print(f"[-] Download failed: {d_resp.get('msg')}")
                 input("Press Enter...")
 
         elif act == '2': # 評分
@@ -726,6 +973,24 @@ class LobbyClient:
         elif act == '3':
             return # 回到上一層 (store_menu)
 
+        elif act == '4' and review_cursor:
+            self._browse_reviews(game_name, review_cursor)
+
+    def _browse_reviews(self, game_name, cursor):
+        """由新到舊逐頁讀取評論，直到沒有更舊的評論或使用者離開"""
+        while cursor:
+            self.reset_req()
+            send_packet(self.sock, MSG_GAME_REVIEWS_REQ, {"game_name": game_name, "cursor": cursor, "limit": 10})
+            resp = self.wait_for_response()
+            if resp.get("status") != "ok":
+                print(f"[-] Failed to load reviews: {resp.get('msg', 'Unknown reason')}")
+                break
+            for r in resp.get("reviews", []):
+                print(f"  [{r['score']}/5] {r['user']}: {r['comment']}")
+            cursor = resp.get("next_cursor")
+            if cursor and input("-- More? (y/n): ").strip().lower() != 'y': return
+        input("(End of reviews) Press Enter...")
+
     def plugin_menu(self):
         print("\n=== Plugin Manager ===")
         self.reset_req()
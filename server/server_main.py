@@ -1,16 +1,25 @@
 import socket
-import select
+import selectors
 import queue
 import sys
 import os
 import json
+import struct
+import hashlib
 import shutil
+import stat
 import subprocess
 import time
 import traceback
 import threading
+import asyncio
+import sqlite3
 import atexit
 import signal
+import itertools
+import zipfile
+import math
+from collections import OrderedDict, deque
 
 # 嘗試引用 utils，若失敗則使用下方的 Fallback 定義
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
@@ -22,14 +31,20 @@ except ImportError:
     MSG_GAME_UPLOAD_INIT = 10; MSG_GAME_UPLOAD_DATA = 11; MSG_GAME_UPLOAD_END = 12
     MSG_GAME_LIST_REQ = 20; MSG_GAME_LIST_RESP = 21; MSG_GAME_DOWNLOAD_REQ = 22
     MSG_GAME_DOWNLOAD_INIT = 23; MSG_GAME_DOWNLOAD_DATA = 24; MSG_GAME_DOWNLOAD_END = 25
+    MSG_GAME_MANIFEST_REQ = 26; MSG_GAME_MANIFEST_RESP = 27
     MSG_ROOM_CREATE_REQ = 30; MSG_ROOM_CREATE_RESP = 31; MSG_ROOM_LIST_REQ = 32
     MSG_ROOM_LIST_RESP = 33; MSG_ROOM_JOIN_REQ = 34; MSG_ROOM_JOIN_RESP = 35
     MSG_ROOM_LEAVE_REQ = 36; MSG_ROOM_STATUS_UPDATE = 37
     MSG_GAME_START_CMD = 38; MSG_GAME_LAUNCH_EVENT = 39
 
     def recv_packet(s): return None, None
+    async def async_recv_packet(r): return None, None
+    def parse_frames(b): return []
     def send_packet(s, t, p): pass
-    def calculate_checksum(f): return "dummy"
+    def encode_packet(t, p, compress=False, encoding=None): return None
+    COMPRESSION_ALGOS = []; SUPPORTED_ENCODINGS = []
+    def calculate_checksum(f, algo="md5"): return "dummy"
+    DELTA_INFO_NAME = "__delta__.json"
 
 # ==========================================
 #  Global Configurations & Constants
@@ -38,46 +53,800 @@ SERVER_IP = '140.113.17.11'        # 部署時的 Public IP
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 USERS_DB = os.path.join(DATA_DIR, 'users.json')
 GAMES_META_DB = os.path.join(DATA_DIR, 'games_meta.json')
+STORE_DB = os.path.join(DATA_DIR, 'store.db')   # 取代上面兩個 JSON 檔，首次啟動時自動匯入
+DB_FLUSH_INTERVAL = 1.0            # 寫入最多延遲幾秒才落地 (write-behind)
+DB_FLUSH_THRESHOLD = 256           # 待寫入筆數達到此數量時立即寫入
+DB_STATS_INTERVAL = 60.0           # 運作期間每隔幾秒 (有寫入時) 印出一次寫入佇列的統計
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), 'uploaded_games')
+BLOB_DIR = os.path.join(UPLOAD_DIR, 'blobs')          # 以內容 sha256 命名的遊戲壓縮檔，相同內容只存一份
+INCOMING_DIR = os.path.join(UPLOAD_DIR, 'incoming')   # 上傳中的暫存檔 (與 blobs 同一檔案系統，完成後直接 rename)
+RUN_ENV_DIR = os.path.join(UPLOAD_DIR, 'run_envs')    # 各房間遊戲 Server 的執行目錄 (hard link 到共用目錄)
+EXTRACT_DIR = os.path.join(UPLOAD_DIR, 'extracted')   # 每個 blob 解壓縮一次的共用唯讀目錄
+DELTA_DIR = os.path.join(UPLOAD_DIR, 'deltas')        # 版本間的差異更新檔，以 <舊 blob>_<新 blob>.zip 命名
+# 房間目錄中以 hard link 共用的檔案類型 (程式碼與素材，遊戲不會改寫)；
+# 其他檔案 (設定、存檔、分數檔…) 每個房間各自複製一份可寫入的副本，改寫不會影響共用目錄
+SHARED_FILE_EXTS = {".py", ".pyc", ".pyd", ".so", ".dll", ".exe", ".jar", ".class",
+                    ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".ico", ".wav", ".ogg", ".mp3", ".ttf", ".otf"}
+DELTA_MAX_RATIO = 0.5              # 差異檔超過完整檔案的這個比例時不值得，直接送完整檔案
+RECV_CHUNK_SIZE = 65536            # 每次 socket 可讀時最多讀取的位元組數
+SEND_BUFFER_LIMIT = 262144         # 每次可寫時最多打包進送出緩衝區的位元組數
+DOWNLOAD_CHUNK_SIZE = 262144       # 每個 MSG_GAME_DOWNLOAD_DATA 封包的 payload 大小
+MANIFEST_CHUNK_SIZE = 1024 * 1024  # 分塊清單中每個分塊的大小 (各自一個 md5)
+ARCHIVE_CACHE_SIZE = 256 * 1024 * 1024     # 熱門壓縮檔記憶體快取的總容量
+ARCHIVE_CACHE_MAX_ITEM = 64 * 1024 * 1024  # 超過此大小的檔案不進快取，直接以 sendfile 送出
+ARCHIVE_CACHE_MIN_HITS = 2         # 同一檔案被完整下載幾次後才讀進快取 (只下載一次的檔案不佔記憶體)
+UPLOAD_WRITE_BUFFER = 1024 * 1024  # 上傳暫存檔的寫入緩衝區，累積滿了才真正寫入磁碟
+UPLOAD_WINDOW = 4 * 1024 * 1024    # 上傳時允許 Client 尚未被確認 (in-flight) 的位元組數
+UPLOAD_CHUNK_SIZE = 256 * 1024     # 建議 Client 每個 MSG_GAME_UPLOAD_DATA 封包的大小
+UPLOAD_ACK_INTERVAL = UPLOAD_WINDOW // 4   # 每寫入這麼多位元組回一次 MSG_GAME_UPLOAD_ACK
+UPLOAD_RESUME_GRACE = 600          # 斷線後保留未完成上傳的秒數，期間內可續傳
+GAME_PORT_MIN = 20000              # game server 使用的 port 範圍 (避開 Linux 預設的 ephemeral 範圍 32768~60999)
+GAME_PORT_MAX = 20999
+LAUNCH_WORKERS = 4                 # 同時進行的遊戲啟動 (解壓縮 + 啟動行程) 數量上限，其餘排隊等候
+LAUNCH_PRIORITY_ROOM = 0           # 啟動佇列的優先順序 (數字小者先)：房間開局優先於預熱行程的補充
+LAUNCH_PRIORITY_PREWARM = 1
+POOL_MAX_PER_VERSION = 4           # 每個 (遊戲, 版本) 最多保留的預熱 game server 數 (需以 --prewarm 啟用)
+POOL_RATE_WINDOW = 600             # 以最近幾秒內的開局次數估計啟動頻率
+POOL_HORIZON = 120                 # 預熱數量 = 預估未來這麼多秒內的開局數
+POOL_WARMUP = 1.0                  # 行程啟動後至少經過幾秒才分配 (等它完成 import 並 listen)
+POOL_CHECK_INTERVAL = 2.0          # 檢查 / 補充行程池的間隔
+POOL_RETIRE_GRACE = 2.0            # 結束多餘行程時，送出 terminate 後等待幾秒才改用 kill
+DETAIL_REVIEW_COUNT = 5            # 詳細資料頁附帶的最新評論數
+REVIEW_PAGE_LIMIT = 50             # MSG_GAME_REVIEWS_REQ 每頁最多回傳的評論數
 
 # ==========================================
 #  Helper Functions
 # ==========================================
-def find_free_port():
-    """尋找一個可用的 Ephemeral Port"""
+def chunk_hashes(path, chunk_size=MANIFEST_CHUNK_SIZE):
+    """計算檔案每個分塊的 md5 (上傳時已邊收邊算，這裡給舊檔案補算用)"""
+    hashes = []
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hashes.append(hashlib.md5(chunk).hexdigest())
+    return hashes
+
+def link_tree(src, dst):
+    """
+    建立 src 的輕量複本：SHARED_FILE_EXTS 類型的檔案以 hard link 共用，不複製內容；
+    其餘檔案 (以及不支援 hard link，例如跨檔案系統的情況) 複製成可寫入的獨立檔案。
+    """
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            s, d = os.path.join(root, name), os.path.join(target, name)
+            if os.path.splitext(name)[1].lower() in SHARED_FILE_EXTS:
+                try:
+                    os.link(s, d)
+                    continue
+                except OSError: pass
+            # 共用目錄中的檔案是唯讀的，副本要恢復可寫入 (與原本每個房間各自解壓縮時相同)
+            shutil.copyfile(s, d)
+            os.chmod(d, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+
+def remove_tree(path):
+    """
+    刪除共用目錄或房間目錄 (失敗時不丟例外，與 rmtree(ignore_errors=True) 相同)。
+    共用目錄的檔案是唯讀的，hard link 到房間的檔案也一樣；Windows 無法刪除唯讀檔案，
+    因此遇到錯誤時先恢復寫入權限再重試一次。
+    """
+    def retry_writable(func, p, _):
+        try:
+            os.chmod(p, os.stat(p).st_mode | stat.S_IWUSR)
+            func(p)
+        except OSError: pass
+    if sys.version_info >= (3, 12): shutil.rmtree(path, onexc=retry_writable)
+    else: shutil.rmtree(path, onerror=retry_writable)
+
+def parse_game_manifest(archive_path, version, strict=True):
+    """
+    讀取並驗證壓縮檔內的 manifest.json，回傳啟動遊戲所需的欄位。
+    格式錯誤時拋出 ValueError，訊息會直接回傳給開發者。
+    strict=False 給驗證規則出現前就已上架的版本用：與舊版相同，只要求 execution.server_cmd。
+    """
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind(('0.0.0.0', 0))
-            return s.getsockname()[1]
-    except Exception:
-        return 0
+        with zipfile.ZipFile(archive_path) as z: m = json.loads(z.read("manifest.json"))
+    except KeyError:
+        raise ValueError("manifest.json not found in archive")
+    except (zipfile.BadZipFile, ValueError) as e:
+        raise ValueError(f"cannot read manifest.json ({e})")
+    if not isinstance(m, dict) or not isinstance(m.get("execution"), dict):
+        raise ValueError("missing 'execution' section")
+    ex = m["execution"]
+    for key in ("server_cmd", "client_cmd") if strict else ("server_cmd",):
+        cmd = ex.get(key)
+        if cmd is None and key == "client_cmd": continue   # 與舊版相同，client_cmd 可省略
+        if not isinstance(cmd, list) or not cmd or not all(isinstance(c, str) for c in cmd):
+            raise ValueError(f"execution.{key} must be a non-empty list of strings")
+    args_format = ex.get("args_format", {})
+    if not strict:
+        fd_flag = args_format.get("listen_fd") if isinstance(args_format, dict) else None
+        return {"execution": {"server_cmd": ex["server_cmd"], "args_format": {"listen_fd": fd_flag} if isinstance(fd_flag, str) else {}}}
+    if not isinstance(args_format, dict):
+        raise ValueError("execution.args_format must be an object")
+    if not isinstance(args_format.get("listen_fd", ""), str):
+        raise ValueError("execution.args_format.listen_fd must be a string")
+    # 玩家端以 manifest 的 version 判斷是否已安裝正確版本，必須與上架版本一致
+    if str(m.get("version", version)) != str(version):
+        raise ValueError(f"manifest version {m.get('version')} does not match {version}")
+    index = {"execution": {"server_cmd": ex["server_cmd"], "args_format": args_format}}
+    if ex.get("client_cmd") is not None: index["execution"]["client_cmd"] = ex["client_cmd"]
+    for key in ("min_players", "max_players"):
+        if key in m:
+            if not isinstance(m[key], int) or isinstance(m[key], bool) or m[key] < 1:
+                raise ValueError(f"{key} must be a positive integer")
+            index[key] = m[key]
+    if index.get("min_players", 1) > index.get("max_players", index.get("min_players", 1)):
+        raise ValueError("min_players is greater than max_players")
+    return index
+
+class PortAllocator:
+    """
+    Game server 的 port 租約。範圍內的 port 依序輪流租出 (剛歸還的 port 最晚才會再被用到)，
+    同一個 port 同時只租給一個遊戲行程，遊戲結束時由 check_game_processes 歸還。
+    租出前實際 bind 一次，略過被其他程式佔用的 port；可直接回傳已 listen 的 socket 交給子行程繼承。
+    """
+    def __init__(self, low=GAME_PORT_MIN, high=GAME_PORT_MAX):
+        self.low, self.high = low, high
+        self.leases = {}       # {port: 租用者 (room_id 或預熱行程名稱)}
+        self.next_port = low
+        self.lock = threading.Lock()   # 啟動遊戲在背景執行緒中租用
+
+    def lease(self, owner, listen=False):
+        """
+        租出一個 port，回傳 (port, socket)。listen=True 時 socket 為已 bind + listen 的 socket，
+        由呼叫端交給子行程後關閉；否則為 None。範圍內沒有可用的 port 時拋出 RuntimeError。
+        """
+        with self.lock:
+            for _ in range(self.high - self.low + 1):
+                port = self.next_port
+                self.next_port = port + 1 if port < self.high else self.low
+                if port in self.leases: continue
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                try:
+                    s.bind(('0.0.0.0', port))
+                except OSError:
+                    s.close()
+                    continue
+                self.leases[port] = owner
+                if listen:
+                    s.listen()
+                    return port, s
+                s.close()
+                return port, None
+        raise RuntimeError("No free ports")
+
+    def release(self, port):
+        with self.lock:
+            self.leases.pop(port, None)
+
+    def stats(self):
+        with self.lock:
+            return {"leased": len(self.leases), "capacity": self.high - self.low + 1}
+
+class DownloadStream:
+    """
+    以 MSG_GAME_DOWNLOAD_DATA 封包串流檔案內容。
+    只有在 socket 可寫時才產生下一個封包，payload 透過 os.sendfile 直接從檔案送出，
+    不論檔案多大，每個下載者佔用的記憶體都是固定的。
+    檔案已在 ArchiveCache 中時改從共用的 buffer 以 memoryview 切片送出，不再讀磁碟。
+    """
+    def __init__(self, path, offset=0, length=None, chunk_size=DOWNLOAD_CHUNK_SIZE, buffer=None):
+        self.path = path
+        self.buffer = buffer
+        self.pos = offset
+        if length is not None: self.end = offset + length
+        else: self.end = len(buffer) if buffer is not None else os.path.getsize(path)
+        self.chunk_size = chunk_size
+        self.frame_remaining = 0   # 目前封包尚未送出的 payload bytes
+        # 建立時就開檔：之後 blob / 差異檔被刪除 (下架、覆蓋版本) 時，已排入佇列的下載仍可送完
+        self.f = open(path, "rb") if buffer is None else None
+
+    def done(self):
+        return self.frame_remaining == 0 and self.pos >= self.end
+
+    def next_header(self):
+        n = min(self.chunk_size, self.end - self.pos)
+        self.frame_remaining = n
+        return struct.pack('>IB', n + 1, MSG_GAME_DOWNLOAD_DATA)
+
+    def payload_span(self):
+        """目前封包剩餘的 payload: (file, offset, count)"""
+        return self.f, self.pos, self.frame_remaining
+
+    def payload_view(self):
+        """目前封包剩餘的 payload (僅限 buffer 模式)，為共用 buffer 的切片，不複製"""
+        return self.buffer[self.pos:self.pos + self.frame_remaining]
+
+    def advance(self, n):
+        self.pos += n
+        self.frame_remaining -= n
+
+    def send_payload(self, sock):
+        """將目前封包的 payload 寫入 non-blocking socket，回傳實際送出的位元組數"""
+        try:
+            if self.buffer is not None:
+                sent = sock.send(self.payload_view())
+            elif hasattr(os, "sendfile"):
+                sent = os.sendfile(sock.fileno(), self.f.fileno(), self.pos, self.frame_remaining)
+            else:
+                # 不支援 sendfile 的平台 (Windows)：一次最多讀一個封包大小
+                self.f.seek(self.pos)
+                sent = sock.send(self.f.read(self.frame_remaining))
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        self.advance(sent)
+        return sent
+
+    def close(self):
+        self.buffer = None   # 放掉參照，快取淘汰後記憶體才能釋放
+        if self.f:
+            try: self.f.close()
+            except: pass
+            self.f = None
+
+def close_queued_streams(q):
+    """連線結束時關閉送出佇列中還沒輪到的 DownloadStream (queue.Queue 或 asyncio.Queue)"""
+    while not q.empty():
+        item = q.get_nowait()
+        if item and isinstance(item[1], DownloadStream): item[1].close()
+
+class ArchiveCache:
+    """
+    熱門壓縮檔的記憶體快取 (LRU，依總位元組數限制)。
+    內容以不可變的 bytes 保存，同時下載同一檔案的連線共用同一份，以 memoryview 切片送出。
+    blob 與差異檔都以內容命名、不會被改寫，不需要失效機制，檔案刪除時呼叫 discard 釋放記憶體即可。
+    只在主執行緒 (或 event loop) 中使用；讀檔由呼叫端在背景執行緒進行，讀完再以 put 放入。
+    """
+    def __init__(self, capacity=ARCHIVE_CACHE_SIZE, max_item=ARCHIVE_CACHE_MAX_ITEM, min_hits=ARCHIVE_CACHE_MIN_HITS):
+        self.capacity = capacity
+        self.max_item = max_item
+        self.min_hits = min_hits
+        self.entries = OrderedDict()   # {path: bytes}，由舊到新
+        self.used = 0
+        self.requests = OrderedDict()  # {path: 未命中次數}，只保留最近的 1024 個檔案
+        self.loading = set()           # 背景讀取中的檔案
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "bypassed": 0, "loads": 0}
+
+    def get(self, path):
+        """
+        回傳 (memoryview 或 None, 是否應在背景讀進快取)。
+        未命中時由呼叫端以 sendfile 送出；同一檔案第 min_hits 次未命中時才要求讀取。
+        """
+        data = self.entries.get(path)
+        if data is not None:
+            self.entries.move_to_end(path)
+            self.metrics["hits"] += 1
+            return memoryview(data), False
+        self.metrics["misses"] += 1
+        if path in self.loading: return None, False
+        n = self.requests.pop(path, 0) + 1
+        self.requests[path] = n
+        if len(self.requests) > 1024: self.requests.popitem(last=False)
+        if n < self.min_hits: return None, False
+        try:
+            if os.path.getsize(path) > self.max_item:
+                self.metrics["bypassed"] += 1
+                return None, False
+        except OSError:
+            return None, False
+        self.loading.add(path)
+        return None, True
+
+    def put(self, path, data):
+        """放入背景讀好的內容；讀取期間檔案已被 discard 時丟棄"""
+        if path not in self.loading: return
+        self.loading.discard(path)
+        self.requests.pop(path, None)
+        if data is None: return
+        self.metrics["loads"] += 1
+        self.entries[path] = data
+        self.used += len(data)
+        while self.used > self.capacity and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.used -= len(old)
+            self.metrics["evictions"] += 1
+
+    def discard(self, path):
+        self.loading.discard(path)
+        self.requests.pop(path, None)
+        data = self.entries.pop(path, None)
+        if data is not None: self.used -= len(data)
+
+    def stats(self):
+        return dict(self.metrics, entries=len(self.entries), bytes=self.used)
+
+# ==========================================
+#  Storage (SQLite, WAL mode)
+# ==========================================
+class GameStoreDB:
+    """
+    使用者、遊戲、版本、評論與遊玩紀錄的持久化層。
+    Server 仍以記憶體中的 users / games_meta 回應查詢，異動時只寫入受影響的資料列；
+    每次寫入都是一個交易，寫到一半當機也不會留下損壞的資料。
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            role TEXT NOT NULL, username TEXT NOT NULL, password TEXT,
+            PRIMARY KEY (role, username));
+        CREATE TABLE IF NOT EXISTS games (
+            name TEXT PRIMARY KEY, id INTEGER UNIQUE, owner TEXT, description TEXT,
+            type TEXT, min_players INTEGER, max_players INTEGER, latest_version TEXT);
+        CREATE TABLE IF NOT EXISTS versions (
+            game TEXT NOT NULL, version TEXT NOT NULL, checksum TEXT, path TEXT,
+            extra TEXT NOT NULL DEFAULT '{}',
+            PRIMARY KEY (game, version));
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, game TEXT NOT NULL,
+            user TEXT, score INTEGER, comment TEXT, time REAL);
+        CREATE INDEX IF NOT EXISTS reviews_by_game ON reviews (game, id);
+        CREATE TABLE IF NOT EXISTS plays (
+            game TEXT NOT NULL, username TEXT NOT NULL,
+            PRIMARY KEY (game, username));
+    """
+    GAME_FIELDS = ("owner", "description", "type", "min_players", "max_players", "latest_version")
+
+    def __init__(self, path):
+        if not os.path.exists(os.path.dirname(path)): os.makedirs(os.path.dirname(path))
+        # 背景執行緒也可能寫入，連線共用並以 lock 保護
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+
+    def execute(self, statements):
+        """在單一交易內執行 [(sql, params), ...]，任一失敗則整批回滾"""
+        with self.lock:
+            try:
+                with self.conn:
+                    for sql, params in statements:
+                        self.conn.execute(sql, params)
+                return True
+            except sqlite3.Error as e:
+                print(f"[!] DB write error: {e}")
+                return False
+
+    def close(self):
+        with self.lock:
+            try: self.conn.close()
+            except sqlite3.Error: pass
+
+    # --- 讀取 (啟動時載入成記憶體中的結構) ---
+    def load_users(self):
+        users = {"player": {}, "developer": {}}
+        for role, username, pwd in self.conn.execute("SELECT role, username, password FROM users"):
+            users.setdefault(role, {})[username] = pwd
+        return users
+
+    def load_games(self):
+        games = {}
+        rows = self.conn.execute("SELECT name, id, " + ", ".join(self.GAME_FIELDS) + " FROM games ORDER BY id")
+        for row in rows:
+            meta = {"id": row[1], "name": row[0], "versions": {}, "reviews": [], "played_by": set(),
+                    "rating_sum": 0, "rating_count": 0}
+            meta.update(zip(self.GAME_FIELDS, row[2:]))
+            if meta["latest_version"] is None: del meta["latest_version"]
+            games[row[0]] = meta
+        for game, version, checksum, path, extra in self.conn.execute(
+                "SELECT game, version, checksum, path, extra FROM versions"):
+            if game in games:
+                info = json.loads(extra)
+                info.update({"checksum": checksum, "path": path})
+                games[game]["versions"][version] = info
+        for game, user, score, comment, t in self.conn.execute(
+                "SELECT game, user, score, comment, time FROM reviews ORDER BY id"):
+            if game in games:
+                games[game]["reviews"].append({"user": user, "score": score, "comment": comment, "time": t})
+                games[game]["rating_sum"] += score or 0
+                games[game]["rating_count"] += 1
+        for game, username in self.conn.execute("SELECT game, username FROM plays ORDER BY rowid"):
+            if game in games:
+                games[game]["played_by"].add(username)
+        return games
+
+    # --- 寫入：各自回傳 SQL 敘述，由 execute() 包成交易 ---
+    def user_ops(self, role, username, pwd):
+        return [("INSERT OR REPLACE INTO users (role, username, password) VALUES (?, ?, ?)", (role, username, pwd))]
+
+    def game_ops(self, name, meta, replace=True):
+        """
+        寫入遊戲本身與所有版本資訊 (評論與遊玩紀錄另外寫入)。
+        replace=False 時使用單純的 INSERT：id 重複會讓交易失敗，而不是默默刪掉另一款遊戲。
+        """
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        ops = [(verb + " INTO games (name, id, " + ", ".join(self.GAME_FIELDS) + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, meta.get("id")) + tuple(meta.get(k) for k in self.GAME_FIELDS))]
+        for version, info in meta.get("versions", {}).items():
+            extra = {k: v for k, v in info.items() if k not in ("checksum", "path")}
+            ops.append((verb + " INTO versions (game, version, checksum, path, extra) VALUES (?, ?, ?, ?, ?)",
+                        (name, version, info.get("checksum"), info.get("path"), json.dumps(extra))))
+        return ops
+
+    def delete_game_ops(self, name):
+        return [("DELETE FROM %s WHERE %s = ?" % (table, col), (name,))
+                for table, col in (("games", "name"), ("versions", "game"), ("reviews", "game"), ("plays", "game"))]
+
+    def review_ops(self, game, entry):
+        return [("INSERT INTO reviews (game, user, score, comment, time) VALUES (?, ?, ?, ?, ?)",
+                 (game, entry.get("user"), entry.get("score"), entry.get("comment"), entry.get("time")))]
+
+    def play_ops(self, game, usernames):
+        return [("INSERT OR IGNORE INTO plays (game, username) VALUES (?, ?)", (game, u)) for u in usernames]
+
+    # --- 從舊版 JSON 檔匯入 ---
+    def needs_migration(self):
+        return self.conn.execute("PRAGMA user_version").fetchone()[0] == 0
+
+    def import_snapshot(self, users, games_meta):
+        """將舊版 users.json / games_meta.json 的內容一次寫入，並標記已完成匯入"""
+        self.renumber_duplicate_ids(games_meta)
+        ops = []
+        for role, accounts in users.items():
+            for username, pwd in accounts.items():
+                ops += self.user_ops(role, username, pwd)
+        for name, meta in games_meta.items():
+            ops += self.game_ops(name, meta, replace=False)
+            for entry in meta.get("reviews", []):
+                ops += self.review_ops(name, entry)
+            ops += self.play_ops(name, meta.get("played_by", []))
+        ops.append(("PRAGMA user_version = 1", ()))
+        return self.execute(ops)
+
+    @staticmethod
+    def renumber_duplicate_ids(games_meta):
+        """
+        舊版以 len(games_meta) + 1 配發 id，下架後再上架會產生重複的 id。
+        依檔案中的順序保留第一個，其餘 (以及缺少 id 的) 改配 max(id) + 1。
+        """
+        ids = [m.get("id") for m in games_meta.values()]
+        next_id = max([i for i in ids if isinstance(i, int)], default=0) + 1
+        seen = set()
+        for name, meta in games_meta.items():
+            gid = meta.get("id")
+            if isinstance(gid, int) and gid not in seen:
+                seen.add(gid)
+                continue
+            meta["id"] = next_id
+            seen.add(next_id)
+            next_id += 1
+            print(f"[*] Game '{name}' had duplicate id {gid}, reassigned to {meta['id']}")
+
+class WriteBehindQueue:
+    """
+    將 handler 產生的寫入操作暫存起來，由背景執行緒定期以單一交易批次寫入 GameStoreDB。
+    同一個 key 的操作 (例如同一款遊戲的 metadata) 只保留最新一筆；key 為 None 的操作依序保留。
+    """
+    def __init__(self, db, interval=DB_FLUSH_INTERVAL, threshold=DB_FLUSH_THRESHOLD, report_interval=DB_STATS_INTERVAL):
+        self.db = db
+        self.interval = interval
+        self.threshold = threshold
+        self.report_interval = report_interval
+        self.next_report = time.time() + report_interval
+        self.pending = OrderedDict()   # {key: [(sql, params), ...]} 依提交順序排列
+        self.oldest = None             # 最早一筆待寫入操作的提交時間
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.metrics = {"flushes": 0, "ops_written": 0, "coalesced": 0, "failed": 0,
+                        "last_flush_ms": 0.0, "max_flush_ms": 0.0, "max_pending_age": 0.0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, ops):
+        with self.cond:
+            if key is None:
+                key = ("seq", next(self.seq))
+            elif key in self.pending:
+                # 舊的那筆已過時：移除後重新排到最後，確保不會覆蓋之後的刪除
+                del self.pending[key]
+                self.metrics["coalesced"] += 1
+            self.pending[key] = ops
+            if self.oldest is None:
+                self.oldest = time.time()
+                self.cond.notify()   # 喚醒閒置中的背景執行緒開始計時
+            elif len(self.pending) >= self.threshold:
+                self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.stopping:
+                    if not self.pending:
+                        self.cond.wait()
+                        continue
+                    remaining = self.interval - (time.time() - self.oldest)
+                    if len(self.pending) >= self.threshold or remaining <= 0: break
+                    self.cond.wait(remaining)
+                if self.stopping: return
+            self.flush()
+
+    def flush(self):
+        """立即寫入所有待寫入操作 (背景執行緒與關機流程共用)"""
+        with self.cond:
+            if not self.pending: return
+            batch, self.pending = list(self.pending.values()), OrderedDict()
+            age, self.oldest = time.time() - self.oldest, None
+        start = time.perf_counter()
+        if not self.db.execute([op for ops in batch for op in ops]):
+            # 整批回滾：逐筆重試，只丟棄真正寫不進去的那幾筆
+            for ops in batch:
+                if not self.db.execute(ops): self.metrics["failed"] += 1
+        elapsed = (time.perf_counter() - start) * 1000
+        m = self.metrics
+        m["flushes"] += 1
+        m["ops_written"] += len(batch)
+        m["last_flush_ms"] = round(elapsed, 2)
+        m["max_flush_ms"] = max(m["max_flush_ms"], m["last_flush_ms"])
+        m["max_pending_age"] = max(m["max_pending_age"], round(age, 3))
+        # 運作期間定期回報 flush 次數與佇列深度 (關機時另外印出最終統計)
+        if not self.stopping and time.time() >= self.next_report:
+            self.next_report = time.time() + self.report_interval
+            print(f"[*] DB writer stats: {self.stats()}")
+
+    def stats(self):
+        with self.cond:
+            age = time.time() - self.oldest if self.oldest else 0.0
+            return dict(self.metrics, pending=len(self.pending), pending_age=round(age, 3))
+
+    def close(self):
+        """停止背景執行緒並寫入剩餘資料"""
+        with self.cond:
+            self.stopping = True
+            self.cond.notify()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.flush()
+
+# ==========================================
+#  Launch Executor
+# ==========================================
+class LaunchExecutor:
+    """
+    以固定數量的背景執行緒處理遊戲啟動，大量房間同時開局時多出來的工作排隊，
+    不會同時解壓縮 / 啟動一大堆行程互搶 CPU 與磁碟。工作依 (priority, 提交順序) 取出，
+    回傳的 (task_type, result) 交給 deliver 送回主迴圈。另外統計佇列深度與各階段耗時。
+    """
+    PHASES = ("queue", "extract", "port_bind", "spawn", "notify", "total")
+
+    def __init__(self, deliver, workers=LAUNCH_WORKERS):
+        self.deliver = deliver
+        self.tasks = queue.PriorityQueue()
+        self.seq = itertools.count()    # 同優先順序時依提交順序，也避免比較到 func
+        self.lock = threading.Lock()
+        self.running = 0
+        self.queued = 0                 # 佇列深度 (尚未開始的工作數)
+        self.metrics = {"submitted": 0, "launched": 0, "failed": 0, "max_queued": 0}
+        self.timings = {p: [0, 0.0, 0.0] for p in self.PHASES}   # {階段: [次數, 總秒數, 最大秒數]}
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for t in self.threads: t.start()
+
+    def submit(self, priority, func, *args):
+        """排入一個工作，回傳排在它前面、尚未開始的工作數"""
+        with self.lock:
+            ahead = self.queued
+            self.queued += 1
+            self.metrics["submitted"] += 1
+            self.metrics["max_queued"] = max(self.metrics["max_queued"], self.queued)
+            self.tasks.put((priority, next(self.seq), func, args))
+        return ahead
+
+    def _run(self):
+        while True:
+            _, _, func, args = self.tasks.get()
+            if func is None: return
+            with self.lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                item = func(*args)
+            except Exception as e:
+                print(f"[!] Launch task error: {e}")
+                item = None
+            finally:
+                with self.lock: self.running -= 1
+            if item: self.deliver(*item)
+
+    def record(self, timings):
+        """記錄一次開局各階段的耗時 (秒)；timings 為 None 代表啟動失敗"""
+        with self.lock:
+            if timings is None:
+                self.metrics["failed"] += 1
+                return
+            self.metrics["launched"] += 1
+            for phase, sec in timings.items():
+                t = self.timings.get(phase)
+                if t is None: continue
+                t[0] += 1; t[1] += sec; t[2] = max(t[2], sec)
+
+    def stats(self):
+        with self.lock:
+            ms = {p: {"avg": round(s / n * 1000, 2), "max": round(m * 1000, 2)}
+                  for p, (n, s, m) in self.timings.items() if n}
+            return dict(self.metrics, queued=self.queued, running=self.running, timings_ms=ms)
+
+    def close(self):
+        """讓所有 worker 結束；尚在排隊的工作不再執行 (優先順序 -1 排在所有工作之前)"""
+        for _ in self.threads:
+            self.tasks.put((-1, next(self.seq), None, ()))
+
+# ==========================================
+#  Game Process Pool
+# ==========================================
+class GameProcessPool:
+    """
+    熱門遊戲的預熱 game server 行程池，以 blob (即 遊戲 + 版本 的內容) 區分。
+    行程事先以 server_cmd --port <port> 在自己的目錄中啟動並等待連線，房間開局時直接分配，
+    省下 interpreter 啟動、import 與找 port 的時間。每個版本保留的數量依最近的開局頻率決定，
+    沒人玩的版本不會佔用行程。只適用於啟動後單純等待玩家連線的 game server，因此預設關閉。
+    """
+    def __init__(self, ports, max_per_version=POOL_MAX_PER_VERSION, window=POOL_RATE_WINDOW, horizon=POOL_HORIZON):
+        self.ports = ports    # PortAllocator，結束行程時歸還 port
+        self.max_per_version = max_per_version
+        self.window = window
+        self.horizon = horizon
+        self.idle = {}        # {blob: [{"proc", "port", "env_dir", "started"}, ...]} 由舊到新
+        self.launches = {}    # {blob: deque(開局時間)}
+        self.spawning = set() # 正在背景補充行程的 blob
+        self.retiring = []    # 已送出 terminate、等待退出的行程 (entry 加上 "deadline")
+        self.lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "spawned": 0, "retired": 0}
+
+    def record_launch(self, blob):
+        self.launches.setdefault(blob, deque()).append(time.time())
+
+    def target(self, blob, now):
+        """依最近 window 秒的開局次數推算這個版本應保留幾個預熱行程"""
+        q = self.launches.get(blob)
+        if not q: return 0
+        while q and q[0] < now - self.window: q.popleft()
+        if not q:
+            del self.launches[blob]
+            return 0
+        return min(self.max_per_version, math.ceil(len(q) / self.window * self.horizon))
+
+    def acquire(self, blob):
+        """取出一個已完成暖機且仍在執行的行程，沒有時回傳 None"""
+        now = time.time()
+        with self.lock:
+            entries = self.idle.get(blob, [])
+            for entry in list(entries):
+                if entry["proc"].poll() is not None:
+                    entries.remove(entry)
+                    self._retire(entry)
+                elif now - entry["started"] >= POOL_WARMUP:
+                    entries.remove(entry)
+                    self.metrics["hits"] += 1
+                    return entry
+            self.metrics["misses"] += 1
+            return None
+
+    def add(self, blob, entries):
+        with self.lock:
+            self.idle.setdefault(blob, []).extend(entries)
+            self.metrics["spawned"] += len(entries)
+
+    def shrink(self, blob, keep):
+        """結束已退出的行程，以及超過 keep 個的多餘行程 (先結束最舊的)"""
+        with self.lock:
+            entries = self.idle.get(blob, [])
+            for entry in [e for e in entries if e["proc"].poll() is not None]:
+                entries.remove(entry)
+                self._retire(entry)
+            while len(entries) > keep:
+                self._retire(entries.pop(0))
+            if not entries: self.idle.pop(blob, None)
+            return len(entries)
+
+    def _retire(self, entry):
+        """送出 terminate 後立即返回 (呼叫端持有 lock)；行程真正退出後才由 reap 歸還 port 與目錄"""
+        try:
+            if entry["proc"].poll() is None: entry["proc"].terminate()
+        except OSError: pass
+        entry["deadline"] = time.time() + POOL_RETIRE_GRACE
+        self.retiring.append(entry)
+
+    def reap(self):
+        """
+        在主迴圈的週期性工作中呼叫，不會等待：已退出的行程歸還 port、刪除工作目錄；
+        超過 POOL_RETIRE_GRACE 仍未退出的改送 kill，下一輪再回收。
+        """
+        now = time.time()
+        with self.lock:
+            for entry in list(self.retiring):
+                if entry["proc"].poll() is None:
+                    if now >= entry["deadline"]:
+                        try: entry["proc"].kill()
+                        except OSError: pass
+                    continue
+                self.retiring.remove(entry)
+                self._release(entry)
+
+    def _release(self, entry):
+        self.ports.release(entry["port"])
+        remove_tree(entry["env_dir"])
+        self.metrics["retired"] += 1
+
+    def close(self):
+        """關機時結束所有行程；此時可以等待，超過 POOL_RETIRE_GRACE 的直接 kill"""
+        for blob in list(self.idle):
+            self.shrink(blob, 0)
+        with self.lock:
+            for entry in self.retiring:
+                try: entry["proc"].wait(timeout=max(0, entry["deadline"] - time.time()))
+                except subprocess.TimeoutExpired:
+                    entry["proc"].kill()
+                    entry["proc"].wait()
+                self._release(entry)
+            self.retiring.clear()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.metrics, idle=sum(len(v) for v in self.idle.values()), retiring=len(self.retiring))
 
 # ==========================================
 #  Main Server Class
 # ==========================================
 class GameStoreServer:
-    def __init__(self):
+    def __init__(self, prewarm=False):
         self.server_socket = None
-        self.inputs = []
-        self.outputs = []
-        self.message_queues = {}
+        # selectors 會自動選用平台最佳實作 (Linux: epoll)，不受 FD_SETSIZE 限制
+        self.selector = selectors.DefaultSelector()
+        self.message_queues = {}   # {socket: queue.Queue} 同時代表「已註冊的連線」
+        self.recv_buffers = {}     # {socket: bytearray} 尚未湊成完整封包的資料
+        self.send_buffers = {}     # {socket: bytearray} 已編碼但尚未送出的資料
+        self.active_streams = {}   # {socket: DownloadStream} 正在送出的下載串流
+        self.archive_cache = ArchiveCache()   # 同一檔案的多個下載者共用記憶體中的內容
         
-        # 資料庫載入
+        # 資料庫載入 (第一次啟動時從舊版 JSON 檔匯入)
         # 結構: {"player": {"u1": "pwd1"}, "developer": {"d1": "pwd2"}}
-        self.users = self.load_users_db()
-        self.games_meta = self.load_json(GAMES_META_DB)
+        self.db = GameStoreDB(STORE_DB)
+        if self.db.needs_migration():
+            self.migrate_json_db()
+        self.users = self.db.load_users()
+        self.games_meta = self.db.load_games()
+        self.db_writer = WriteBehindQueue(self.db)   # handler 的寫入一律經由此佇列
+        self.game_ids = {meta["id"]: name for name, meta in self.games_meta.items()}  # {game_id: game_name}
+        self.blob_refs = {}        # {sha256: 引用此 blob 的版本數}
+        # 共用解壓縮目錄的使用計數 (背景執行緒解壓縮 / 建立房間目錄期間)，使用中不可刪除
+        self.tree_lock = threading.Lock()
+        self.tree_users = {}       # {blob: 使用中的背景工作數}
+        self.doomed_trees = set()  # blob 已被釋放、等最後一個使用者結束後刪除的共用目錄
+        self.init_blob_store()
+        # {(舊 blob, 新 blob): {"path", "size", "checksum"}}，None 表示差異太大、不提供差異更新
+        self.deltas = {}
+        self.delta_pending = set() # 正在背景計算的差異檔
+        self.init_delta_store()
+        self.init_run_envs()
         
         # 連線與狀態管理
         self.socket_map = {}       # {socket: {"username":..., "role":...}}
         # 用於快速查詢該帳號是否已登入，以實作「踢除舊連線」
         self.active_sessions = {}  # {(role, username): socket} - 用於防止重複登入
+        self.peer_caps = {}        # {socket: {"compress": "zlib", "encoding": "json"}} 登入時協商的能力
         self.rooms = {}            # {room_id: room_info}
+        self.user_rooms = {}       # {username: room_id} 玩家目前所在的房間
         self.next_room_id = 1
+        # 已編碼的商城回應封包 {(種類, ..., compress, encoding): frame bytes}
+        # 只有上架 / 下架 / 評分會改變內容，由這三個 handler 負責失效
+        self.catalog_cache = {}
         
         # 上傳與遊戲執行狀態
         self.upload_states = {}    # 處理大檔案分塊上傳
+        self.suspended_uploads = {}  # {upload_id: state} 斷線時尚未完成的上傳，等待續傳
         self.running_games = {}    # {room_id: subprocess}
+        self.room_envs = {}        # {room_id: 遊戲行程的工作目錄}，遊戲結束時刪除
+        self.room_ports = {}       # {room_id: 租給該房間 game server 的 port}
+        self.port_allocator = PortAllocator()
+        # 預熱 game server 行程池 (--prewarm 啟用)
+        self.process_pool = GameProcessPool(self.port_allocator) if prewarm else None
+        self.next_pool_check = 0
+        self.pool_env_ids = itertools.count(1)
         self.thread_results = queue.Queue()
+        self.wakeup_r = self.wakeup_w = None   # 背景結果送達時喚醒 select (start 時建立)
+        # 遊戲啟動與預熱行程的補充共用固定數量的 worker
+        self.launch_executor = LaunchExecutor(self.post_result)
 
         # 註冊資源清理
         atexit.register(self.cleanup_server)
@@ -87,22 +856,21 @@ class GameStoreServer:
     # -------------------------------------------------
     #  Core: Networking & Loop
     # -------------------------------------------------
-    def start(self):
-        """啟動伺服器主迴圈"""
+    def _open_listen_socket(self):
+        """詢問 Port 並建立 non-blocking 的監聽 socket (select / asyncio 兩種模式共用)"""
         if not os.path.exists(UPLOAD_DIR): os.makedirs(UPLOAD_DIR)
-        
+
         # Port 配置 (允許動態輸入以避免衝突)
         while True:
             try:
                 port_input = input(f"Enter Server Port (Default 12365): ")
                 port = int(port_input) if port_input else 12365
-                
+
                 self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 self.server_socket.bind(('0.0.0.0', port)) # Bind to all interfaces
                 self.server_socket.listen(10)
                 self.server_socket.setblocking(False)
-                self.inputs = [self.server_socket]
                 print(f"[*] Server running on {SERVER_IP}:{port}")
                 break
             except ValueError:
@@ -111,58 +879,61 @@ class GameStoreServer:
                 print(f"[!] Port {port} is busy or unavailable ({e}). Please try another.")
                 try: self.server_socket.close()
                 except: pass
-        
-        # Main Select Loop(還有socket在監聽就繼續)
-        while self.inputs:
+
+    def start(self):
+        """啟動伺服器主迴圈"""
+        self._open_listen_socket()
+        self.selector.register(self.server_socket, selectors.EVENT_READ)
+        # 背景工作完成時寫入一個位元組，讓 select 立即返回，不必等到 timeout 才通知玩家
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        for s in (self.wakeup_r, self.wakeup_w): s.setblocking(False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+
+        # Main Event Loop(還有socket在監聽就繼續)
+        # 只有「有事件」的 socket 會被回傳，閒置連線不會增加每輪的成本
+        while self.selector.get_map():
             try:
-                readable, writable, exceptional = select.select(self.inputs, self.outputs, self.inputs, 0.1)
+                events = self.selector.select(timeout=0.1)
                 
-                # 傳入資料的socket處理
-                for s in readable:
+                for key, mask in events:
+                    s = key.fileobj
                     if s is self.server_socket:
                         # 有新連線進來
                         try:
                             conn, addr = s.accept()
-                            #conn.setblocking(False)
-                            self.inputs.append(conn)
+                            conn.setblocking(False)
                             self.message_queues[conn] = queue.Queue()
+                            self.recv_buffers[conn] = bytearray()
+                            self.send_buffers[conn] = bytearray()
+                            self.selector.register(conn, selectors.EVENT_READ)
                             print(f"[+] New connection from {addr}")
                         except Exception as e:
                             print(f"[!] Accept failed: {e}")
+                        continue
+                    if s is self.wakeup_r:
+                        # 結果由下方的 run_periodic_tasks 處理
+                        try: s.recv(4096)
+                        except OSError: pass
+                        continue
+
                     # client socket 有資料可讀取
-                    else:
+                    if mask & selectors.EVENT_READ:
                         try:
-                            msg_type, payload = recv_packet(s)
-                            if msg_type is not None:
-                                self.handle_packet(s, msg_type, payload)
-                            else:
-                                self.handle_disconnect(s)
+                            self.handle_readable(s)
                         except Exception as e:
                             print(f"[!] Error processing packet: {e}")
                             self.handle_disconnect(s)
 
-                # 寫入資料的socket處理
-                for s in writable:
-                    try:
-                        # 此client有資料要發送
-                        if s in self.message_queues and not self.message_queues[s].empty():
-                            try:
-                                msg_type, payload = self.message_queues[s].get_nowait()
-                                send_packet(s, msg_type, payload)
-                            except queue.Empty: pass
-                        else:
-                            if s in self.outputs: self.outputs.remove(s)
-                    except Exception as e:
-                        print(f"[!] Write failed for {s.fileno()}: {e}")
-                        self.handle_disconnect(s)
-                
-                # 處理異常socket
-                for s in exceptional:
-                    self.handle_disconnect(s)
+                    # 寫入資料的socket處理 (讀取時可能已斷線)
+                    if mask & selectors.EVENT_WRITE and s in self.message_queues:
+                        try:
+                            self.handle_writable(s)
+                        except Exception as e:
+                            print(f"[!] Write failed for {s.fileno()}: {e}")
+                            self.handle_disconnect(s)
 
                 # 處理背景任務結果與檢查子行程
-                self.process_thread_results()
-                self.check_game_processes()
+                self.run_periodic_tasks()
 
             except KeyboardInterrupt:
                 print("\n[*] Server stopping...")
@@ -173,6 +944,81 @@ class GameStoreServer:
 
         self.cleanup_server()
 
+    def handle_readable(self, sock):
+        """
+        每次可讀只呼叫一次 recv，將資料累積在該連線的緩衝區，
+        只處理已完整的封包；半個封包會留著等下一次可讀，不會卡住主迴圈。
+        """
+        try:
+            data = sock.recv(RECV_CHUNK_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        if not data:
+            self.handle_disconnect(sock)
+            return
+
+        buf = self.recv_buffers.get(sock)
+        if buf is None: return
+        buf += data
+        for msg_type, payload in parse_frames(buf):
+            self.handle_packet(sock, msg_type, payload)
+            # Handler 內可能已經斷線 (例如上傳寫檔失敗)
+            if sock not in self.recv_buffers: break
+
+    def handle_writable(self, sock):
+        """
+        將佇列中的封包盡量打包進同一個送出緩衝區，一次 send 出去；
+        socket 收不下的部分留在緩衝區，下次可寫時從中斷處繼續。
+        遇到 DownloadStream 時，先送完該串流 (header + sendfile) 才繼續處理佇列。
+        """
+        q = self.message_queues.get(sock)
+        buf = self.send_buffers.get(sock)
+        if q is None or buf is None: return
+
+        while True:
+            if buf:
+                try:
+                    sent = sock.send(buf)
+                except (BlockingIOError, InterruptedError):
+                    sent = 0
+                del buf[:sent]
+                # Kernel 緩衝區已滿，等下一次可寫
+                if buf: break
+
+            stream = self.active_streams.get(sock)
+            if stream is not None:
+                if stream.frame_remaining:
+                    stream.send_payload(sock)
+                    if stream.frame_remaining: break
+                elif stream.done():
+                    stream.close()
+                    del self.active_streams[sock]
+                else:
+                    buf += stream.next_header()
+                continue
+
+            while len(buf) < SEND_BUFFER_LIMIT:
+                try: msg_type, payload = q.get_nowait()
+                except queue.Empty: break
+                if isinstance(payload, DownloadStream):
+                    self.active_streams[sock] = payload
+                    break
+                frame = self.encode_for(sock, msg_type, payload)
+                if frame: buf += frame
+            if not buf and sock not in self.active_streams: break
+
+        if not buf and q.empty() and sock not in self.active_streams:
+            self._watch_writable(sock, False)
+
+    def _watch_writable(self, sock, enabled):
+        """依送出佇列狀態切換該 socket 的 EVENT_WRITE 監聽"""
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if enabled else 0)
+        try:
+            if self.selector.get_key(sock).events != events:
+                self.selector.modify(sock, events)
+        except (KeyError, ValueError):
+            pass
+
     def handle_packet(self, sock, msg_type, payload):
         """封包路由分發器"""
         handlers = {
@@ -190,6 +1036,7 @@ class GameStoreServer:
             MSG_GAME_UPLOAD_END: self.handle_upload_end,
             MSG_GAME_LIST_REQ: self.handle_game_list,
             MSG_GAME_DOWNLOAD_REQ: self.handle_game_download,
+            MSG_GAME_MANIFEST_REQ: self.handle_game_manifest,
             # Game Launch
             MSG_GAME_START_CMD: self.handle_game_start,
             MSG_GAME_REMOVE_REQ: self.handle_game_remove, 
@@ -197,6 +1044,7 @@ class GameStoreServer:
             MSG_DEV_MY_GAMES_REQ: self.handle_dev_my_games,
             MSG_READY_CHECK_RESP: self.handle_ready_check_resp,
             MSG_GAME_DETAIL_REQ: self.handle_game_detail,
+            MSG_GAME_REVIEWS_REQ: self.handle_game_reviews,
             
             # Plugin
             MSG_PLUGIN_LIST_REQ: self.handle_plugin_list,
@@ -248,13 +1096,32 @@ class GameStoreServer:
             # 登入成功，記錄 Session
             self.active_sessions[key] = sock
             self.socket_map[sock] = {"username": username, "role": role}
+            caps = self._negotiate_caps(sock, data.get("caps"))
             
             print(f"[+] {role.capitalize()} logged in: {username}")
-            self.send_to(sock, MSG_LOGIN_RESP, {"status": "ok", "msg": "Success"})
+            self.send_to(sock, MSG_LOGIN_RESP, {"status": "ok", "msg": "Success", "caps": caps})
         else:
             print(f"[-] Login failed for {role} {username}")
             self.send_to(sock, MSG_LOGIN_RESP, {"status": "error", "msg": "Invalid credentials"})
 
+    def _negotiate_caps(self, sock, client_caps):
+        """依 Client 登入時提供的能力清單，選出雙方都支援的選項"""
+        caps = {}
+        if isinstance(client_caps, dict):
+            offered = client_caps.get("compress") or []
+            for algo in COMPRESSION_ALGOS:
+                if algo in offered:
+                    caps["compress"] = algo
+                    break
+            # 有宣告 encodings 代表 Client 看得懂 Typed Frame
+            offered = client_caps.get("encodings") or []
+            for enc in SUPPORTED_ENCODINGS:
+                if enc in offered:
+                    caps["encoding"] = enc
+                    break
+        self.peer_caps[sock] = caps
+        return caps
+
     def handle_register(self, sock, data):
         username = data.get("username")
         pwd = data.get("password")
@@ -274,7 +1141,7 @@ class GameStoreServer:
         else:
             # 註冊成功
             user_db[username] = pwd
-            self.save_json(USERS_DB, self.users)
+            self.db_writer.submit(("user", role, username), self.db.user_ops(role, username, pwd))
             print(f"[+] Registered new {role}: {username}")
             self.send_to(sock, MSG_REGISTER_RESP, {"status": "ok", "msg": "Registered"})
 
@@ -305,12 +1172,9 @@ class GameStoreServer:
         game_id = data.get("game_id", 1)
         
         # 查找對應遊戲資料
-        game_name = "Unknown"
-        for name, meta in self.games_meta.items():
-            if meta["id"] == int(game_id):
-                game_name = name
-                game_meta = meta
-                break
+        try: game_name = self.game_ids.get(int(game_id))
+        except (TypeError, ValueError): game_name = None
+        game_meta = self.games_meta.get(game_name)
         
         if not game_name or not game_meta:
             self.send_to(sock, MSG_ROOM_CREATE_RESP, {"status": "error", "msg": "Invalid Game ID"})
@@ -332,6 +1196,7 @@ class GameStoreServer:
             "status": "WAITING"
         }
         self.rooms[room_id] = room_info
+        self.user_rooms[username] = room_id
         self.send_to(sock, MSG_ROOM_CREATE_RESP, {"status": "ok", "room": room_info})
         print(f"[*] Room {room_id} created by {username} (Max: {max_p})")
 
@@ -351,6 +1216,7 @@ class GameStoreServer:
             if len(room["members"]) < room["max_players"] and room["status"] == "WAITING":
                 self.handle_leave_room(sock, None) 
                 room["members"].append(username)
+                self.user_rooms[username] = rid
                 self.send_to(sock, MSG_ROOM_JOIN_RESP, {"status": "ok", "room": room})
                 self.broadcast_room_status(rid)
             else:
@@ -362,13 +1228,8 @@ class GameStoreServer:
         username = self.get_player_name(sock)
         if not username: return
         
-        target_rid = None
-        for rid, room in self.rooms.items():
-            if username in room["members"]:
-                target_rid = rid
-                break
-        
-        if target_rid:
+        target_rid = self.user_rooms.pop(username, None)
+        if target_rid in self.rooms:
             room = self.rooms[target_rid]
             if username in room["members"]:
                 room["members"].remove(username)
@@ -389,18 +1250,12 @@ class GameStoreServer:
         username = self.get_player_name(sock)
         if not username: return
         
-        # 找出房間
-        room = None
-        for r in self.rooms.values():
-            if username in r["members"]:
-                room = r; break
-        
+        room = self.room_of(username)
         if room:
             packet = {"user": username, "msg": data.get("msg", "")}
             # 廣播給房間所有人 (包含沒裝 Plugin 的人，讓 Client 自己決定要不要顯示)
-            for s, info in self.socket_map.items():
-                if info["role"] == "player" and info["username"] in room["members"]:
-                    self.send_to(s, MSG_ROOM_CHAT, packet)
+            for s in self.member_sockets(room["members"]):
+                self.send_to(s, MSG_ROOM_CHAT, packet)
 
     # -------------------------------------------------
     #  Handlers: Game Store (Upload/Info/Rate)
@@ -415,58 +1270,170 @@ class GameStoreServer:
         game_name = data.get("name")
         version = data.get("version")
         checksum = data.get("checksum")
-        save_dir = os.path.join(UPLOAD_DIR, game_name, version)
-        if not os.path.exists(save_dir): os.makedirs(save_dir)
-        temp_file_path = os.path.join(save_dir, "game_archive.zip.tmp")
-        
+        if not os.path.exists(INCOMING_DIR): os.makedirs(INCOMING_DIR)
+        # 同一位開發者上傳同一份檔案 (同名、同版本、同 checksum) 會得到相同的 upload_id
+        upload_id = hashlib.sha1(json.dumps(
+            [user_info["username"], game_name, version, checksum]).encode()).hexdigest()
+        # 這條連線上若有尚未結束的上傳，視同放棄
+        self._discard_upload(self.upload_states.pop(sock, None))
+
+        # 舊連線可能還沒被偵測到斷線，先把它的上傳狀態收回來
+        for other, st in list(self.upload_states.items()):
+            if st["upload_id"] == upload_id: self._suspend_upload(other)
+        state = self.suspended_uploads.pop(upload_id, None)
+        if not data.get("resume"):
+            # Client 沒要求續傳：從頭開始，舊的暫存檔不再需要
+            self._discard_upload(state)
+            state = None
+
         try:
-            f = open(temp_file_path, "wb")
-            self.upload_states[sock] = {
-                "file_handle": f, "path": temp_file_path,
-                "final_path": os.path.join(save_dir, "game_archive.zip"),
-                "expected_checksum": checksum, "meta": data
-            }
-            self.send_to(sock, MSG_GAME_UPLOAD_INIT, {"status": "ready"})
+            if state:
+                f = open(state["path"], "r+b", buffering=UPLOAD_WRITE_BUFFER)
+                f.truncate(state["received"])
+                f.seek(state["received"])
+                print(f"[*] Resuming upload {game_name} v{version} at {state['received']} bytes")
+            else:
+                temp_file_path = os.path.join(INCOMING_DIR, f"{upload_id}.tmp")
+                f = open(temp_file_path, "wb", buffering=UPLOAD_WRITE_BUFFER)
+                state = {
+                    "upload_id": upload_id, "path": temp_file_path,
+                    "expected_checksum": checksum, "meta": data,
+                    # 邊收邊算 md5 (驗證) 與 sha256 (blob 名稱)，結束時不必再把整個檔案讀一遍
+                    "hasher": hashlib.md5(), "sha256": hashlib.sha256(), "received": 0,
+                    # 分塊清單也邊收邊算：已完成分塊的 md5 與目前分塊的 hasher
+                    "chunks": [], "chunk_hasher": hashlib.md5(), "chunk_fill": 0,
+                    # asyncio 模式下寫檔在 executor 執行，關閉 / 換檔前都要先取得此 lock
+                    "lock": threading.RLock()
+                }
+            # Client 要求流量控制時才回 ACK，舊版 Client 不會收到看不懂的封包
+            state.update({"file_handle": f, "flow_control": bool(data.get("flow_control")),
+                          "acked": state["received"]})
+            self.upload_states[sock] = state
+            resp = {"status": "ready", "upload_id": upload_id, "offset": state["received"]}
+            if data.get("flow_control"):
+                resp.update({"window": UPLOAD_WINDOW, "chunk_size": UPLOAD_CHUNK_SIZE})
+            self.send_to(sock, MSG_GAME_UPLOAD_INIT, resp)
         except Exception as e:
             self.send_to(sock, MSG_GAME_UPLOAD_INIT, {"status": "error", "msg": str(e)})
 
+    def _suspend_upload(self, sock):
+        """連線中斷時保留上傳進度 (暫存檔 + md5 狀態)，在 UPLOAD_RESUME_GRACE 秒內可續傳"""
+        state = self.upload_states.pop(sock, None)
+        if not state: return
+        with state["lock"]:
+            if state.get("failed"):
+                self._discard_upload(state); return
+            try: state["file_handle"].close()   # 會先把緩衝區內容寫入磁碟
+            except Exception:
+                self._discard_upload(state); return
+            state["file_handle"] = None
+        state["expires"] = time.time() + UPLOAD_RESUME_GRACE
+        self.suspended_uploads[state["upload_id"]] = state
+
+    def _discard_upload(self, state):
+        if not state: return
+        with state["lock"]:
+            try:
+                if state.get("file_handle"): state["file_handle"].close()
+            except Exception: pass
+            state["file_handle"] = None
+        try: os.remove(state["path"])
+        except OSError: pass
+
+    def expire_suspended_uploads(self):
+        now = time.time()
+        for upload_id, state in list(self.suspended_uploads.items()):
+            if state["expires"] <= now:
+                del self.suspended_uploads[upload_id]
+                self._discard_upload(state)
+                print(f"[*] Discarded unfinished upload {state['meta'].get('name')} v{state['meta'].get('version')}")
+
     def handle_upload_data(self, sock, data):
-        if sock in self.upload_states:
-            try: self.upload_states[sock]["file_handle"].write(data)
-            except: self.handle_disconnect(sock)
+        """
+        asyncio 模式下於 executor 執行：只在 state["lock"] 內寫檔，
+        upload_states 的增刪與關檔一律留在主迴圈 (_suspend_upload / _discard_upload 會先取得同一把 lock)。
+        """
+        state = self.upload_states.get(sock)
+        if not state: return
+        ack = None
+        with state["lock"]:
+            # 等 lock 期間可能已被暫停、放棄，或被另一條連線接手續傳
+            if self.upload_states.get(sock) is not state or not state["file_handle"]: return
+            try:
+                state["file_handle"].write(data)
+                state["hasher"].update(data)
+                state["sha256"].update(data)
+                self._hash_chunks(state, data)
+                state["received"] += len(data)
+            except Exception:
+                # 寫入失敗 (例如磁碟已滿)：這份暫存檔不可信，斷線時直接丟棄，不保留續傳
+                state["failed"] = True
+            if not state.get("failed") and state["flow_control"] and state["received"] - state["acked"] >= UPLOAD_ACK_INTERVAL:
+                state["acked"] = ack = state["received"]
+        if state.get("failed"):
+            self.handle_disconnect(sock); return
+        if ack is not None:
+            self.send_to(sock, MSG_GAME_UPLOAD_ACK, {"received": ack, "window": UPLOAD_WINDOW})
+
+    def _hash_chunks(self, state, data):
+        """依 MANIFEST_CHUNK_SIZE 切開收到的資料，更新分塊 md5"""
+        view = memoryview(data)
+        while len(view):
+            part = view[:MANIFEST_CHUNK_SIZE - state["chunk_fill"]]
+            state["chunk_hasher"].update(part)
+            state["chunk_fill"] += len(part)
+            view = view[len(part):]
+            if state["chunk_fill"] == MANIFEST_CHUNK_SIZE:
+                state["chunks"].append(state["chunk_hasher"].hexdigest())
+                state["chunk_hasher"], state["chunk_fill"] = hashlib.md5(), 0
 
     def handle_upload_end(self, sock, _=None):
-        if sock not in self.upload_states: return
-        state = self.upload_states[sock]
-        state["file_handle"].close()
+        state = self.upload_states.pop(sock, None)
+        if not state: return
+        with state["lock"]:
+            state["file_handle"].close()
+            state["file_handle"] = None
+        if state.get("failed"):
+            self._discard_upload(state); return
         
         # 取得上傳者身分
         user_info = self.socket_map.get(sock)
         if not user_info: 
-            del self.upload_states[sock]; return
-            
-        if calculate_checksum(state["path"]) == state["expected_checksum"]:
-            if os.path.exists(state["final_path"]): os.remove(state["final_path"])
-            os.rename(state["path"], state["final_path"])
+            self._discard_upload(state); return
             
+        if state["hasher"].hexdigest() == state["expected_checksum"]:
             meta = state["meta"]
             g_name = meta["name"]
-            
-            # 更新檢查：如果是更新，檢查擁有權
+
+            # 更新檢查：如果是更新，檢查擁有權 (在檔案進入 blob store 之前)
             if g_name in self.games_meta:
                 existing_owner = self.games_meta[g_name].get("owner")
                 # 如果有記錄 owner 且不是當前用戶 -> 拒絕
                 if existing_owner and existing_owner != user_info["username"]:
                     self.send_to(sock, MSG_GAME_UPLOAD_END, {"status": "error", "msg": "Permission denied: You do not own this game"})
                     print(f"[-] Update denied: {user_info['username']} tried to update {g_name} (owned by {existing_owner})")
-                    del self.upload_states[sock]
+                    self._discard_upload(state)
                     return
 
+            # 上架前先驗證 manifest，格式錯誤的遊戲不會進入商城
+            try:
+                manifest = parse_game_manifest(state["path"], meta["version"])
+            except ValueError as e:
+                self.send_to(sock, MSG_GAME_UPLOAD_END, {"status": "error", "msg": f"Invalid manifest: {e}"})
+                print(f"[-] Upload rejected: {g_name} v{meta['version']} has an invalid manifest ({e})")
+                self._discard_upload(state)
+                return
+
+            blob = state["sha256"].hexdigest()
+            blob_path = self.store_blob(state["path"], blob)
+
             if g_name not in self.games_meta:
                 self.games_meta[g_name] = {
-                    "id": len(self.games_meta) + 1, 
+                    # 下架後 len()+1 可能與既有遊戲重複，改取目前最大 id + 1
+                    "id": max(self.game_ids, default=0) + 1, 
                     "name": g_name, 
                     "versions": {},
+                    "reviews": [], "played_by": set(), "rating_sum": 0, "rating_count": 0,
                     "owner": user_info["username"],
                     # 初始化 (如果第一次上傳)
                     "description": meta.get("description", ""),
@@ -477,41 +1444,59 @@ class GameStoreServer:
             # [Spec Add] 每次更新都覆寫這些 Metadata
             self.games_meta[g_name]["description"] = meta.get("description", "")
             self.games_meta[g_name]["type"] = meta.get("type", "CLI")
-            self.games_meta[g_name]["min_players"] = int(meta.get("min_players", 2)) # 強制轉 int
-            self.games_meta[g_name]["max_players"] = int(meta.get("max_players", 2))
+            # 人數以 manifest 為準，沒寫才用上傳請求中的值
+            self.games_meta[g_name]["min_players"] = int(manifest.get("min_players", meta.get("min_players", 2))) # 強制轉 int
+            self.games_meta[g_name]["max_players"] = int(manifest.get("max_players", meta.get("max_players", 2)))
             self.games_meta[g_name]["owner"] = user_info["username"]
+            self.game_ids[self.games_meta[g_name]["id"]] = g_name
+            prev_info = self.games_meta[g_name]["versions"].get(self.games_meta[g_name].get("latest_version"))
             self.games_meta[g_name]["latest_version"] = meta["version"]
+            # 同一版本重新上傳時，舊內容的引用要釋放 (先加後減，內容相同時不會被刪掉)
+            old_info = self.games_meta[g_name]["versions"].get(meta["version"])
+            if state["chunk_fill"]: state["chunks"].append(state["chunk_hasher"].hexdigest())
             self.games_meta[g_name]["versions"][meta["version"]] = {
-                "checksum": state["expected_checksum"], 
-                "path": state["final_path"]
+                "checksum": state["expected_checksum"],
+                "path": blob_path, "blob": blob,
+                "chunk_size": MANIFEST_CHUNK_SIZE, "chunks": state["chunks"],
+                "manifest": manifest
             }
-            self.save_json(GAMES_META_DB, self.games_meta)
+            if old_info: self.release_blob(old_info.get("blob"))
+            # 預先在背景算好「上一版 -> 這一版」的差異檔，玩家更新時只需下載變動的檔案
+            if prev_info and prev_info is not old_info and prev_info.get("blob"):
+                self.schedule_delta(prev_info["blob"], blob)
+            self.db_writer.submit(("game", g_name), self.db.game_ops(g_name, self.games_meta[g_name]))
+            self.invalidate_catalog(g_name)
             self.send_to(sock, MSG_GAME_UPLOAD_END, {"status": "ok"})
             print(f"[+] Upload Success: {g_name} v{meta['version']}")
         else:
             self.send_to(sock, MSG_GAME_UPLOAD_END, {"status": "error", "msg": "Checksum mismatch"})
-            
-        del self.upload_states[sock]
+            self._discard_upload(state)
 
     def handle_game_list(self, sock, data):
         print("[Debug] Received game list request from", sock)
         try:
-            game_list = []
-            for name, meta in self.games_meta.items():
-                game_list.append({
-                    "id": meta.get("id", 0),
-                    "name": name,
-                    "version": meta["latest_version"],
-                    "min_players": meta.get("min_players", 2),
-                    "max_players": meta.get("max_players", 2),
-                    "owner": meta.get("owner", "Unknown")
-                })
-            self.send_to(sock, MSG_GAME_LIST_RESP, {"status": "ok", "games": game_list})
+            self.send_cached(sock, ("list",), MSG_GAME_LIST_RESP, self._build_game_list)
         except Exception as e:
             print("[!] handle_game_list error:", e)
             self.send_to(sock, MSG_GAME_LIST_RESP, {"status": "error", "msg": str(e)})
 
+    def _build_game_list(self):
+        game_list = []
+        for name, meta in self.games_meta.items():
+            game_list.append({
+                "id": meta.get("id", 0),
+                "name": name,
+                "version": meta["latest_version"],
+                "min_players": meta.get("min_players", 2),
+                "max_players": meta.get("max_players", 2),
+                "owner": meta.get("owner", "Unknown")
+            })
+        return {"status": "ok", "games": game_list}
+
     def handle_game_download(self, sock, data):
+        if "length" in data:
+            self._handle_range_download(sock, data)
+            return
         game_name = data.get("game_name")
         if game_name in self.games_meta:
             latest = self.games_meta[game_name]["latest_version"]
@@ -519,13 +1504,31 @@ class GameStoreServer:
             f_path = f_info["path"]
             if os.path.exists(f_path):
                 try:
-                    self.send_to(sock, MSG_GAME_DOWNLOAD_INIT, {
-                        "status": "ok", "size": os.path.getsize(f_path), 
+                    size = os.path.getsize(f_path)
+                    # 斷點續傳：Client 手上的部分檔案必須是同一版本、同一個 checksum 才能接續
+                    offset = 0
+                    if data.get("checksum") == f_info["checksum"] and data.get("version", latest) == latest:
+                        try: offset = int(data.get("offset", 0))
+                        except (TypeError, ValueError): offset = 0
+                        if not 0 <= offset <= size: offset = 0
+
+                    resp = {
+                        "status": "ok", "size": size, "offset": offset,
                         "checksum": f_info["checksum"], "version": latest, "game_name": game_name
-                    })
-                    with open(f_path, "rb") as f:
-                        while chunk := f.read(4096): 
-                            self.send_to(sock, MSG_GAME_DOWNLOAD_DATA, chunk)
+                    }
+                    # 已安裝舊版本：有算好的差異檔就只送差異，size / checksum 改為差異檔的值
+                    installed = data.get("installed_version")
+                    delta = None
+                    if not offset and installed != latest and installed in self.games_meta[game_name]["versions"]:
+                        delta = self.find_delta(self.games_meta[game_name]["versions"][installed], f_info)
+                    if delta:
+                        f_path = delta["path"]
+                        resp.update({"size": delta["size"], "checksum": delta["checksum"], "delta_from": installed})
+
+                    stream = DownloadStream(f_path, offset=offset, buffer=self.cached_archive(f_path))
+                    self.send_to(sock, MSG_GAME_DOWNLOAD_INIT, resp)
+                    # 檔案內容在 socket 可寫時才逐段送出，不預先讀進佇列
+                    self.send_to(sock, MSG_GAME_DOWNLOAD_DATA, stream)
                     self.send_to(sock, MSG_GAME_DOWNLOAD_END, {})
                 except Exception as e:
                     print(f"[!] Download error: {e}")
@@ -534,6 +1537,67 @@ class GameStoreServer:
         else:
             self.send_to(sock, MSG_GAME_DOWNLOAD_INIT, {"status": "error", "msg": "Game not found"})
 
+    def cached_archive(self, path):
+        """
+        回傳快取中的檔案內容 (沒有則為 None，以 sendfile 送出)。
+        重複被下載的檔案交給背景執行緒讀取，讀完 (ARCHIVE_LOADED) 後之後的下載才改由記憶體送出，不會卡住主迴圈。
+        """
+        data, load = self.archive_cache.get(path)
+        if load: self.run_in_background(self._load_archive_worker, path)
+        return data
+
+    def _load_archive_worker(self, path):
+        try:
+            with open(path, "rb") as f: data = f.read()
+        except OSError:
+            data = None
+        return ("ARCHIVE_LOADED", {"path": path, "data": data})
+
+    def handle_game_manifest(self, sock, data):
+        """回傳最新版本的分塊清單；Client 已安裝舊版本時一併告知是否有差異檔可用"""
+        meta = self.games_meta.get(data.get("game_name"))
+        if not meta:
+            self.send_to(sock, MSG_GAME_MANIFEST_RESP, {"status": "error", "msg": "Game not found"})
+            return
+        latest = meta["latest_version"]
+        info = meta["versions"][latest]
+        if not info.get("chunks") or not os.path.exists(info["path"]):
+            self.send_to(sock, MSG_GAME_MANIFEST_RESP, {"status": "error", "msg": "File missing"})
+            return
+        installed = data.get("installed_version")
+        delta = None
+        if installed != latest and installed in meta["versions"]:
+            delta = self.find_delta(meta["versions"][installed], info)
+        self.send_to(sock, MSG_GAME_MANIFEST_RESP, {
+            "status": "ok", "game_name": meta["name"], "version": latest,
+            "size": os.path.getsize(info["path"]), "checksum": info["checksum"],
+            "chunk_size": info["chunk_size"], "chunks": info["chunks"],
+            "delta_size": delta["size"] if delta else None
+        })
+
+    def _handle_range_download(self, sock, data):
+        """
+        分塊下載：送出指定版本 [offset, offset + length) 的內容，回應格式與完整下載相同。
+        version / checksum 須與分塊清單一致，下載途中版本被覆蓋時回傳錯誤。
+        """
+        meta = self.games_meta.get(data.get("game_name"))
+        info = meta["versions"].get(data.get("version")) if meta else None
+        if not info or info["checksum"] != data.get("checksum") or not os.path.exists(info["path"]):
+            self.send_to(sock, MSG_GAME_DOWNLOAD_INIT, {"status": "error", "msg": "Version no longer available"})
+            return
+        try: offset, length = int(data.get("offset", 0)), int(data["length"])
+        except (TypeError, ValueError): offset = length = -1
+        if offset < 0 or length <= 0 or offset + length > os.path.getsize(info["path"]):
+            self.send_to(sock, MSG_GAME_DOWNLOAD_INIT, {"status": "error", "msg": "Invalid range"})
+            return
+        self.send_to(sock, MSG_GAME_DOWNLOAD_INIT, {
+            "status": "ok", "offset": offset, "length": length,
+            "version": data["version"], "game_name": meta["name"]
+        })
+        # 分塊只是檔案的一小段，直接 sendfile，不為此把整個檔案讀進快取
+        self.send_to(sock, MSG_GAME_DOWNLOAD_DATA, DownloadStream(info["path"], offset=offset, length=length))
+        self.send_to(sock, MSG_GAME_DOWNLOAD_END, {})
+
     # 獲取遊戲詳細資訊與評價 ---
     def handle_game_detail(self, sock, data):
         game_name = data.get("game_name")
@@ -541,24 +1605,24 @@ class GameStoreServer:
             self.send_to(sock, MSG_GAME_DETAIL_RESP, {"status": "error", "msg": "Game not found"})
             return
 
-        meta = self.games_meta[game_name]
-        
-        # 計算平均評分
-        reviews = meta.get("reviews", [])
-        avg_score = 0.0
-        if reviews:
-            total = sum(r["score"] for r in reviews)
-            avg_score = round(total / len(reviews), 1)
-
         # 檢查當前用戶是否玩過
         user_info = self.socket_map.get(sock)
         has_played = False
         if user_info:
-            username = user_info["username"]
-            played_list = meta.get("played_by", [])
-            if username in played_list:
-                has_played = True
-                
+            has_played = user_info["username"] in self.games_meta[game_name].get("played_by", [])
+
+        self.send_cached(sock, ("detail", game_name, has_played), MSG_GAME_DETAIL_RESP,
+                         lambda: self._build_game_detail(game_name, has_played))
+
+    def _build_game_detail(self, game_name, has_played):
+        meta = self.games_meta[game_name]
+        
+        # 平均評分由評分時維護的總和 / 筆數算出，不必掃過全部評論
+        reviews = meta.get("reviews", [])
+        count = meta.get("rating_count", 0)
+        avg_score = round(meta.get("rating_sum", 0) / count, 1) if count else 0.0
+        latest_start = max(0, len(reviews) - DETAIL_REVIEW_COUNT)
+
         # 打包回傳資料
         # 根據 Spec，需包含：名稱、作者、版本、簡介、評分、評論
         resp_data = {
@@ -571,10 +1635,222 @@ class GameStoreServer:
             "min_players": meta.get("min_players", 2), # 新增
             "max_players": meta.get("max_players", 2), # 新增
             "avg_score": avg_score,
-            "reviews": reviews[-5:],
+            "review_count": count,
+            "reviews": reviews[latest_start:],
+            "next_cursor": latest_start or None,   # 還有更舊的評論時，可用 MSG_GAME_REVIEWS_REQ 繼續讀取
             "has_played": has_played
         }
-        self.send_to(sock, MSG_GAME_DETAIL_RESP, resp_data)
+        return resp_data
+
+    def handle_game_reviews(self, sock, data):
+        """
+        以 cursor 分頁讀取評論 (由新到舊翻頁，每頁內維持時間順序)。
+        評論只會附加在尾端，因此 cursor 直接使用串列索引：回傳 [cursor - limit, cursor) 這一段。
+        """
+        game_name = data.get("game_name")
+        if game_name not in self.games_meta:
+            self.send_to(sock, MSG_GAME_REVIEWS_RESP, {"status": "error", "msg": "Game not found"})
+            return
+        reviews = self.games_meta[game_name].get("reviews", [])
+        try:
+            end = data.get("cursor")
+            end = len(reviews) if end is None else min(int(end), len(reviews))
+            limit = max(1, min(int(data.get("limit", REVIEW_PAGE_LIMIT)), REVIEW_PAGE_LIMIT))
+        except (TypeError, ValueError):
+            self.send_to(sock, MSG_GAME_REVIEWS_RESP, {"status": "error", "msg": "Invalid cursor"})
+            return
+        start = max(0, end - limit)
+        self.send_to(sock, MSG_GAME_REVIEWS_RESP, {
+            "status": "ok", "game_name": game_name,
+            "reviews": reviews[start:end] if end > 0 else [],
+            "next_cursor": start or None
+        })
+
+    # -------------------------------------------------
+    #  Blob Store (content-addressed archives)
+    # -------------------------------------------------
+    def blob_path(self, blob):
+        return os.path.join(BLOB_DIR, blob + ".zip")
+
+    def store_blob(self, src_path, blob):
+        """將檔案放進 blob store 並增加引用數；相同內容已存在時直接丟棄 src_path"""
+        dest = self.blob_path(blob)
+        if os.path.exists(dest): os.remove(src_path)
+        else: os.replace(src_path, dest)
+        self.blob_refs[blob] = self.blob_refs.get(blob, 0) + 1
+        # 重新上傳了等待刪除的內容：共用目錄不必刪了
+        with self.tree_lock: self.doomed_trees.discard(blob)
+        return dest
+
+    def release_blob(self, blob):
+        if not blob: return
+        n = self.blob_refs.get(blob, 0) - 1
+        if n > 0:
+            self.blob_refs[blob] = n
+            return
+        self.blob_refs.pop(blob, None)
+        self.archive_cache.discard(self.blob_path(blob))
+        try: os.remove(self.blob_path(blob))
+        except OSError: pass
+        # 執行中的房間持有自己的 hard link，刪除共用目錄不影響它們；
+        # 但背景執行緒正在解壓縮 / 建立 hard link 時要等它們結束 (由 drop_tree 刪除)
+        with self.tree_lock:
+            busy = bool(self.tree_users.get(blob))
+            if busy: self.doomed_trees.add(blob)
+        if not busy: remove_tree(self.shared_tree_path(blob))
+        for key in [k for k in self.deltas if blob in k]:
+            self._remove_delta(key)
+        print(f"[*] Removed unreferenced blob {blob[:12]}")
+
+    def init_blob_store(self):
+        """
+        由 games_meta 推算各 blob 的引用數。
+        舊版存放在 <game>/<version>/game_archive.zip 的檔案會在此一次搬進 blob store。
+        """
+        if not os.path.exists(BLOB_DIR): os.makedirs(BLOB_DIR)
+        for name, meta in self.games_meta.items():
+            migrated = False
+            for ver, info in meta.get("versions", {}).items():
+                if info.get("blob"):
+                    self.blob_refs[info["blob"]] = self.blob_refs.get(info["blob"], 0) + 1
+                elif info.get("path") and os.path.exists(info["path"]):
+                    old_path = info["path"]
+                    info["blob"] = calculate_checksum(old_path, "sha256")
+                    info["path"] = self.store_blob(old_path, info["blob"])
+                    try: os.rmdir(os.path.dirname(old_path))
+                    except OSError: pass
+                    migrated = True
+                # 分塊清單出現之前上傳的版本：補算一次
+                if info.get("blob") and "chunks" not in info and os.path.exists(info["path"]):
+                    info["chunk_size"], info["chunks"] = MANIFEST_CHUNK_SIZE, chunk_hashes(info["path"])
+                    migrated = True
+                if info.get("blob") and "manifest" not in info and os.path.exists(info["path"]):
+                    try:
+                        info["manifest"] = parse_game_manifest(info["path"], ver)
+                        migrated = True
+                    except ValueError as e:
+                        # 驗證規則出現前就已上架：改用舊版的寬鬆檢查，仍能開局的版本不要因此下線
+                        try:
+                            info["manifest"] = parse_game_manifest(info["path"], ver, strict=False)
+                            migrated = True
+                            print(f"[*] {name} v{ver}: manifest does not pass upload checks ({e}), launching with server_cmd only")
+                        except ValueError as e:
+                            print(f"[!] {name} v{ver}: invalid manifest, this version cannot be launched ({e})")
+            if migrated:
+                self.db_writer.submit(("game", name), self.db.game_ops(name, meta))
+                print(f"[*] Updated archive index of '{name}'")
+
+    # -------------------------------------------------
+    #  Delta Updates
+    # -------------------------------------------------
+    def delta_path(self, old_blob, new_blob):
+        return os.path.join(DELTA_DIR, f"{old_blob}_{new_blob}.zip")
+
+    def init_delta_store(self):
+        """載入上次算好的差異檔；引用的 blob 已不存在的直接刪除"""
+        if not os.path.exists(DELTA_DIR): os.makedirs(DELTA_DIR)
+        for fname in os.listdir(DELTA_DIR):
+            path = os.path.join(DELTA_DIR, fname)
+            key = tuple(fname[:-len(".zip")].split("_"))
+            if fname.endswith(".zip") and len(key) == 2 and all(b in self.blob_refs for b in key):
+                self.deltas[key] = {"path": path, "size": os.path.getsize(path), "checksum": calculate_checksum(path)}
+            else:
+                try: os.remove(path)
+                except OSError: pass
+
+    def find_delta(self, old_info, new_info):
+        """回傳可用的差異檔；還沒算過就排入背景計算，這次先送完整檔案"""
+        key = (old_info.get("blob"), new_info.get("blob"))
+        if None in key or key[0] == key[1]: return None
+        if key not in self.deltas:
+            self.schedule_delta(*key)
+        return self.deltas.get(key)
+
+    def schedule_delta(self, old_blob, new_blob):
+        key = (old_blob, new_blob)
+        if old_blob == new_blob or key in self.deltas or key in self.delta_pending: return
+        self.delta_pending.add(key)
+        self.run_in_background(self._build_delta_worker, {
+            "key": key, "old_path": self.blob_path(old_blob), "new_path": self.blob_path(new_blob),
+            "dest": self.delta_path(old_blob, new_blob)
+        })
+
+    def _build_delta_worker(self, job):
+        """
+        比對兩個 zip 的目錄 (CRC + 大小，不必解壓縮)，將新增或變動的檔案另存成差異檔。
+        差異檔內的 DELTA_INFO_NAME 記錄要刪除的檔案，以及新版本全部檔案的 CRC 供 Client 驗證。
+        """
+        dest = job["dest"]
+        tmp = dest + ".tmp"
+        try:
+            with zipfile.ZipFile(job["old_path"]) as old, zipfile.ZipFile(job["new_path"]) as new:
+                old_files = {i.filename: (i.CRC, i.file_size) for i in old.infolist() if not i.is_dir()}
+                new_files = [i for i in new.infolist() if not i.is_dir()]
+                changed = [i for i in new_files if old_files.get(i.filename) != (i.CRC, i.file_size)]
+                info = {
+                    "removed": sorted(set(old_files) - {i.filename for i in new_files}),
+                    "files": {i.filename: i.CRC for i in new_files}
+                }
+                with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as out:
+                    out.writestr(DELTA_INFO_NAME, json.dumps(info))
+                    for i in changed:
+                        zi = zipfile.ZipInfo(i.filename, i.date_time)
+                        zi.compress_type, zi.external_attr, zi.file_size = zipfile.ZIP_DEFLATED, i.external_attr, i.file_size
+                        with new.open(i) as src, out.open(zi, "w") as dst:
+                            shutil.copyfileobj(src, dst, 1024 * 1024)
+            size = os.path.getsize(tmp)
+            if size > os.path.getsize(job["new_path"]) * DELTA_MAX_RATIO:
+                os.remove(tmp)
+                return ("DELTA_READY", {"key": job["key"], "delta": None})
+            os.replace(tmp, dest)
+            return ("DELTA_READY", {"key": job["key"], "delta": {
+                "path": dest, "size": size, "checksum": calculate_checksum(dest)}})
+        except Exception as e:
+            try: os.remove(tmp)
+            except OSError: pass
+            return ("DELTA_FAIL", {"key": job["key"], "msg": str(e)})
+
+    def on_delta_ready(self, result):
+        key, delta = result["key"], result["delta"]
+        self.delta_pending.discard(key)
+        # 計算期間其中一個版本被下架或覆蓋：差異檔已無用
+        if not all(b in self.blob_refs for b in key):
+            if delta:
+                try: os.remove(delta["path"])
+                except OSError: pass
+            return
+        self.deltas[key] = delta
+        if delta: print(f"[*] Delta {key[0][:8]} -> {key[1][:8]} ready ({delta['size']} bytes)")
+
+    def on_delta_failed(self, result):
+        self.delta_pending.discard(result["key"])
+        print(f"[!] Delta build failed: {result['msg']}")
+
+    def _remove_delta(self, key):
+        delta = self.deltas.pop(key, None)
+        if delta:
+            self.archive_cache.discard(delta["path"])
+            try: os.remove(delta["path"])
+            except OSError: pass
+
+    # -------------------------------------------------
+    #  Catalog Cache
+    # -------------------------------------------------
+    def send_cached(self, sock, key, msg_type, build):
+        """送出快取的已編碼回應；未命中時呼叫 build() 產生 payload 並依連線能力編碼後存入"""
+        caps = self.peer_caps.get(sock) or {}
+        key = key + (caps.get("compress"), caps.get("encoding"))
+        frame = self.catalog_cache.get(key)
+        if frame is None:
+            frame = self.encode_for(sock, msg_type, build())
+            self.catalog_cache[key] = frame
+        self.send_to(sock, None, frame)
+
+    def invalidate_catalog(self, game_name=None):
+        """遊戲清單一律失效；指定 game_name 時只清掉該遊戲的詳細資料"""
+        for key in list(self.catalog_cache):
+            if key[0] == "list" or game_name is None or key[1] == game_name:
+                del self.catalog_cache[key]
 
     # 評分邏輯：加入資格檢查
     def handle_game_rate(self, sock, data):
@@ -593,14 +1869,17 @@ class GameStoreServer:
             return
 
         # 檢查是否玩過
-        played_list = self.games_meta[game_name].get("played_by", [])
-        if username not in played_list:
+        if username not in self.games_meta[game_name].get("played_by", ()):
             print(f"[-] Rate denied: {username} hasn't played {game_name}")
             self.send_to(sock, MSG_GAME_RATE_RESP, {"status": "error", "msg": "You must play this game first!"})
             return
 
-        if "reviews" not in self.games_meta[game_name]:
-            self.games_meta[game_name]["reviews"] = []
+        # 分數會計入平均評分，必須是 1~5 的整數
+        if not isinstance(score, int) or isinstance(score, bool) or not 1 <= score <= 5:
+            self.send_to(sock, MSG_GAME_RATE_RESP, {"status": "error", "msg": "Score must be 1-5"})
+            return
+
+        meta = self.games_meta[game_name]
 
         review_entry = {
             "user": username,
@@ -608,8 +1887,11 @@ class GameStoreServer:
             "comment": comment,
             "time": time.time()
         }
-        self.games_meta[game_name]["reviews"].append(review_entry)
-        self.save_json(GAMES_META_DB, self.games_meta)
+        meta.setdefault("reviews", []).append(review_entry)
+        meta["rating_sum"] = meta.get("rating_sum", 0) + score
+        meta["rating_count"] = meta.get("rating_count", 0) + 1
+        self.db_writer.submit(None, self.db.review_ops(game_name, review_entry))
+        self.invalidate_catalog(game_name)
 
         print(f"[*] New review for {game_name} from {username}")
         self.send_to(sock, MSG_GAME_RATE_RESP, {"status": "ok", "msg": "Review added"})
@@ -646,11 +1928,13 @@ class GameStoreServer:
 
             # 安全下架
             del self.games_meta[game_name]
-            self.save_json(GAMES_META_DB, self.games_meta)
-            
-            # (選擇性) 刪除實體檔案，或保留檔案但移除索引
-            # 這裡為了安全起見，通常只移除索引(下架)，保留檔案以免誤刪
-            # 若要刪除檔案： shutil.rmtree(os.path.join(UPLOAD_DIR, game_name))
+            self.game_ids.pop(game_id, None)
+            self.db_writer.submit(None, self.db.delete_game_ops(game_name))
+            self.invalidate_catalog(game_name)
+
+            # 釋放各版本對 blob 的引用，沒有其他版本共用的檔案才會真正刪除
+            for info in game_data.get("versions", {}).values():
+                self.release_blob(info.get("blob"))
             
             print(f"[*] Game '{game_name}' removed by {user_info['username']}")
             self.send_to(sock, MSG_GAME_REMOVE_RESP, {"status": "ok", "msg": "Game removed from store."})
@@ -681,26 +1965,17 @@ class GameStoreServer:
         username = self.get_player_name(sock)
         if not username: return
 
-        room = None
-        for r in self.rooms.values():
-            if username in r["members"]:
-                room = r; break
-        
+        room = self.room_of(username)
         if not room or room["host"] != username: return
 
         # 檢查房間人數是否足夠
         # 動態判斷最小人數
         min_p = room.get("min_players", 2)
-        if len(r["members"]) < min_p:
+        if len(room["members"]) < min_p:
             self.send_to(sock, MSG_GAME_START_FAIL, {"msg": f"Not enough players (Min {min_p})"})
             return
         
-        game_id = room["game_id"]
-        game_meta = None
-        for name, meta in self.games_meta.items():
-            if meta["id"] == game_id:
-                game_meta = meta; break
-        
+        game_meta = self.games_meta.get(self.game_ids.get(room["game_id"]))
         if not game_meta: return
 
         latest_version = game_meta.get("latest_version", "1.0")
@@ -713,7 +1988,8 @@ class GameStoreServer:
             "responses": 0,
             "all_ok": True,
             "failed_reason": None,
-            "game_meta": game_meta,
+            # 只存名稱：room 會廣播給 Client，不能夾帶完整的 games_meta (played_by 為 set)
+            "game_name": game_meta["name"],
             "version": latest_version
         }
 
@@ -724,9 +2000,8 @@ class GameStoreServer:
         }
         
         # 找出房間內所有 socket 發送請求
-        for s, info in self.socket_map.items():
-            if info["role"] == "player" and info["username"] in room["members"]:
-                self.send_to(s, MSG_READY_CHECK_REQ, check_req)
+        for s in self.member_sockets(room["members"]):
+            self.send_to(s, MSG_READY_CHECK_REQ, check_req)
 
     # 遊戲啟動流程 Step 2: 收集回報
     def handle_ready_check_resp(self, sock, data):
@@ -734,11 +2009,7 @@ class GameStoreServer:
         if not username: return
 
         # 找到該玩家所在的房間
-        room = None
-        for r in self.rooms.values():
-            if username in r["members"]:
-                room = r; break
-        
+        room = self.room_of(username)
         if not room or "ready_check" not in room: return
 
         check = room["ready_check"]
@@ -754,13 +2025,12 @@ class GameStoreServer:
         if check["responses"] >= check["target_count"]:
             if check["all_ok"]:
                 # 全員通過 -> 真正啟動遊戲
-                self._start_game_sequence(room, check["game_meta"], check["version"])
+                self._start_game_sequence(room, self.games_meta[check["game_name"]], check["version"])
             else:
                 # 有人失敗 -> 廣播失敗訊息，取消啟動
                 fail_packet = {"msg": f"Start Failed! {check['failed_reason']}"}
-                for s, info in self.socket_map.items():
-                    if info["role"] == "player" and info["username"] in room["members"]:
-                        self.send_to(s, MSG_GAME_START_FAIL, fail_packet)
+                for s in self.member_sockets(room["members"]):
+                    self.send_to(s, MSG_GAME_START_FAIL, fail_packet)
             
             # 清除檢查狀態
             del room["ready_check"]
@@ -768,52 +2038,106 @@ class GameStoreServer:
     # 真正啟動邏輯
     def _start_game_sequence(self, room, game_meta, version):
         print(f"[*] All players ready. Launching Room {room['id']}...")
+        blob = game_meta["versions"][game_meta["latest_version"]].get("blob")
+        if self.process_pool and blob:
+            self.process_pool.record_launch(blob)
+            entry = self.process_pool.acquire(blob)
+            if entry:
+                # 已有預熱好的行程：不必進背景執行緒，立即通知玩家連線
+                print(f"[*] Room {room['id']} uses pre-warmed server on port {entry['port']}")
+                self.on_game_launched({
+                    "room_id": room["id"], "pid": entry["proc"].pid, "proc": entry["proc"],
+                    "port": entry["port"], "env_dir": entry["env_dir"], "game_id": room["game_id"],
+                    "members": list(room["members"]), "version": version
+                })
+                return
         task_data = {
             "room_id": room["id"], "game_meta": game_meta,
             "game_id": room["game_id"], "members": list(room["members"]),
-            "latest_version": version
+            "latest_version": version, "queued_at": time.perf_counter()
         }
-        # 使用執行緒啟動子行程，避免卡住主迴圈
-        t = threading.Thread(target=self._launch_game_worker, args=(task_data,))
+        # 交給啟動 worker 在背景啟動子行程，避免卡住主迴圈；worker 都在忙時排隊
+        ahead = self.launch_executor.submit(LAUNCH_PRIORITY_ROOM, self._launch_game_worker, task_data)
+        if ahead: print(f"[*] Room {room['id']} queued for launch ({ahead} task(s) ahead)")
+
+    def run_in_background(self, func, *args):
+        """
+        在背景執行緒執行 func，其回傳的 (task_type, result) 會放入 thread_results，
+        由主迴圈的 process_thread_results 處理。
+        """
+        t = threading.Thread(target=lambda: self.post_result(*func(*args)))
         t.daemon = True; t.start()
 
+    def post_result(self, task_type, result):
+        """由背景執行緒將結果交回主迴圈 (LaunchExecutor 使用)"""
+        self.thread_results.put((task_type, result))
+        if self.wakeup_w:
+            try: self.wakeup_w.send(b"\0")
+            except OSError: pass   # 緩衝區已滿代表主迴圈本來就會被喚醒
+
     def _launch_game_worker(self, data):
         room_id = data["room_id"]
         game_meta = data["game_meta"]
+        start = time.perf_counter()
+        timings = {"queue": start - data["queued_at"]}
         try:
-            # 解壓縮與準備環境
+            # 準備環境：同一版本只解壓縮一次，房間目錄只建立 hard link
             latest_ver = game_meta["latest_version"]
-            archive_path = game_meta["versions"][latest_ver]["path"]
-            base_dir = os.path.dirname(archive_path) 
-            extract_dir = os.path.join(base_dir, f"run_env_{room_id}")
-            if os.path.exists(extract_dir): shutil.rmtree(extract_dir, ignore_errors=True)
-            os.makedirs(extract_dir)
-            
-            import zipfile
-            with zipfile.ZipFile(archive_path, 'r') as z: z.extractall(extract_dir)
-        
-            manifest_path = os.path.join(extract_dir, "manifest.json")
-            with open(manifest_path) as f: manifest = json.load(f)
-            if "execution" not in manifest or "server_cmd" not in manifest["execution"]:
-                raise ValueError("Manifest error")
-
-            server_cmd = manifest["execution"]["server_cmd"]
-            game_port = find_free_port()
-            if game_port == 0: raise RuntimeError("No free ports")
-
-            cmd = list(server_cmd) + ["--port", str(game_port)]
-            proc = subprocess.Popen(cmd, cwd=extract_dir)
+            info = game_meta["versions"][latest_ver]
+            if not info.get("blob"): raise ValueError("Archive missing")
+            # 啟動指令來自上架時驗證過的 manifest，不必先解壓縮才知道能否啟動；
+            # 沒有索引的舊版本 (例如啟動時壓縮檔還讀不到) 在這裡以寬鬆規則補讀
+            manifest = info.get("manifest") or parse_game_manifest(info["path"], latest_ver, strict=False)
+            self.hold_tree(info["blob"])
+            try:
+                tree = self.prepare_shared_tree(info["blob"], info["path"])
+                extract_dir = self.make_room_env(room_id, tree)
+            finally:
+                self.drop_tree(info["blob"])
+            timings["extract"] = time.perf_counter() - start
+            proc, game_port = self.spawn_game_server(manifest, extract_dir, room_id, timings)
             
             result = {
                 "room_id": room_id, "pid": proc.pid, "proc": proc,
-                "port": game_port, "game_id": data["game_id"], "members": data["members"],
-                "version": data["latest_version"]
+                "port": game_port, "env_dir": extract_dir, "game_id": data["game_id"], "members": data["members"],
+                "version": data["latest_version"],
+                "timings": timings, "queued_at": data["queued_at"], "ready_at": time.perf_counter()
             }
-            self.thread_results.put(("GAME_LAUNCH_SUCCESS", result))
+            return ("GAME_LAUNCH_SUCCESS", result)
         except Exception as e:
             err_msg = str(e)
             print(f"[!] Launch Error (Room {room_id}): {err_msg}")
-            self.thread_results.put(("GAME_LAUNCH_FAIL", {"room_id": room_id, "msg": err_msg}))
+            return ("GAME_LAUNCH_FAIL", {"room_id": room_id, "msg": err_msg})
+
+    def spawn_game_server(self, manifest, cwd, owner, timings=None):
+        """
+        租一個 port 並啟動 game server，回傳 (proc, port)。
+        manifest 的 args_format 宣告 listen_fd 時，另外以該參數傳入已 listen 的 socket (fd 繼承)，
+        game server 直接使用，從租出到子行程接手之間不會被其他程式搶走。
+        有傳入 timings 時記錄 port_bind / spawn 兩個階段的耗時。
+        """
+        execution = manifest["execution"]
+        fd_flag = execution.get("args_format", {}).get("listen_fd") if os.name == "posix" else None
+        t0 = time.perf_counter()
+        port, listener = self.port_allocator.lease(owner, listen=bool(fd_flag))
+        t1 = time.perf_counter()
+        cmd = list(execution["server_cmd"]) + ["--port", str(port)]
+        try:
+            if listener:
+                cmd += [fd_flag, str(listener.fileno())]
+                proc = subprocess.Popen(cmd, cwd=cwd, pass_fds=(listener.fileno(),))
+            else:
+                proc = subprocess.Popen(cmd, cwd=cwd)
+        except Exception:
+            self.port_allocator.release(port)
+            raise
+        finally:
+            # 子行程已繼承 listening socket，Server 這端不再需要
+            if listener: listener.close()
+        if timings is not None:
+            timings["port_bind"] = t1 - t0
+            timings["spawn"] = time.perf_counter() - t1
+        return proc, port
 
     # 遊戲啟動成功後，記錄玩家已遊玩
     def on_game_launched(self, result):
@@ -822,27 +2146,20 @@ class GameStoreServer:
         
         # 記錄正在執行的遊戲process
         self.running_games[room_id] = result["proc"]
+        self.room_envs[room_id] = result["env_dir"]
+        self.room_ports[room_id] = result["port"]
         
         # 1. 找出遊戲名稱並更新 played_by 紀錄
-        target_game_name = None
-        for name, meta in self.games_meta.items():
-            if meta["id"] == game_id:
-                target_game_name = name
-                break
-        
-        if target_game_name:
-            if "played_by" not in self.games_meta[target_game_name]:
-                self.games_meta[target_game_name]["played_by"] = []
-            
+        target_game_name = self.game_ids.get(game_id)
+        if target_game_name in self.games_meta:
+            played_by = self.games_meta[target_game_name].setdefault("played_by", set())
+
             # 將房間內的成員加入遊玩紀錄 (避免重複)
-            changed = False
-            for member in result["members"]:
-                if member not in self.games_meta[target_game_name]["played_by"]:
-                    self.games_meta[target_game_name]["played_by"].append(member)
-                    changed = True
+            new_players = [m for m in result["members"] if m not in played_by]
+            played_by.update(new_players)
             
-            if changed:
-                self.save_json(GAMES_META_DB, self.games_meta)
+            if new_players:
+                self.db_writer.submit(None, self.db.play_ops(target_game_name, new_players))
                 print(f"[*] Updated play history for {target_game_name}")
 
         # 2. 通知房間成員與更新狀態 (保持原樣)
@@ -856,14 +2173,134 @@ class GameStoreServer:
                 "game_id": result["game_id"],
                 "version": result.get("version", "1.0")
             }
-            for s, info in self.socket_map.items():
-                if info["role"] == "player" and info["username"] in result["members"]:
-                    self.send_to(s, MSG_GAME_LAUNCH_EVENT, packet)
+            for s in self.member_sockets(result["members"]):
+                self.send_to(s, MSG_GAME_LAUNCH_EVENT, packet)
         
-        print(f"[*] Room {room_id} launched on port {result['port']} (PID: {result['pid']})")
+        timings = result.get("timings")
+        if timings is None:
+            print(f"[*] Room {room_id} launched on port {result['port']} (PID: {result['pid']})")
+            return
+        # notify：worker 完成到主迴圈送出開局通知；total：從排入啟動佇列算起
+        now = time.perf_counter()
+        timings["notify"] = now - result["ready_at"]
+        timings["total"] = now - result["queued_at"]
+        self.launch_executor.record(timings)
+        detail = ", ".join(f"{p} {timings[p] * 1000:.0f}ms" for p in LaunchExecutor.PHASES if p in timings)
+        print(f"[*] Room {room_id} launched on port {result['port']} (PID: {result['pid']}) [{detail}]")
 
     def on_game_launch_failed(self, result):
+        self.launch_executor.record(None)
         print(f"[!] Room {result['room_id']} failed to launch: {result['msg']}")
+
+    # -------------------------------------------------
+    #  Run Environments (shared extracted trees)
+    # -------------------------------------------------
+    def shared_tree_path(self, blob):
+        return os.path.join(EXTRACT_DIR, blob)
+
+    def room_env_path(self, room_id):
+        return os.path.join(RUN_ENV_DIR, f"room_{room_id}")
+
+    def hold_tree(self, blob):
+        """背景工作開始使用 blob 的共用目錄 (prepare_shared_tree / link_tree 前呼叫)"""
+        with self.tree_lock: self.tree_users[blob] = self.tree_users.get(blob, 0) + 1
+
+    def drop_tree(self, blob):
+        """背景工作用完共用目錄；blob 已在期間被釋放時，由最後一個使用者刪除目錄"""
+        with self.tree_lock:
+            n = self.tree_users.pop(blob, 0) - 1
+            if n > 0:
+                self.tree_users[blob] = n
+                return
+            if blob not in self.doomed_trees: return
+            self.doomed_trees.discard(blob)
+        remove_tree(self.shared_tree_path(blob))
+
+    def prepare_shared_tree(self, blob, archive_path):
+        """
+        回傳 blob 的共用解壓縮目錄，第一次啟動這個版本時才解壓縮 (於背景執行緒呼叫)。
+        先解壓到暫存目錄再 rename，多個房間同時啟動同一版本也只會留下一份完整的目錄。
+        """
+        tree = self.shared_tree_path(blob)
+        if os.path.isdir(tree): return tree
+        tmp = f"{tree}.{threading.get_ident()}.tmp"
+        remove_tree(tmp)
+        with zipfile.ZipFile(archive_path, 'r') as z: z.extractall(tmp)
+        # 共用目錄設為唯讀；hard link 只用在程式碼與素材 (SHARED_FILE_EXTS)，其餘檔案各房間各自複製
+        for root, dirs, files in os.walk(tmp):
+            for name in files: os.chmod(os.path.join(root, name), stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        try:
+            os.rename(tmp, tree)
+        except OSError:
+            # 另一個房間已先完成解壓縮
+            remove_tree(tmp)
+            if not os.path.isdir(tree): raise
+        return tree
+
+    def make_room_env(self, room_id, tree):
+        """建立房間的工作目錄：目錄結構與共用目錄相同，程式碼與素材為 hard link；遊戲寫入的檔案只留在這裡"""
+        room_dir = self.room_env_path(room_id)
+        remove_tree(room_dir)
+        link_tree(tree, room_dir)
+        return room_dir
+
+    # -------------------------------------------------
+    #  Process Pool (pre-warmed game servers)
+    # -------------------------------------------------
+    def maintain_process_pool(self):
+        """
+        每 POOL_CHECK_INTERVAL 秒調整一次各版本的預熱行程數：
+        只為各遊戲的最新版本保留行程，不足時在背景補充，多餘或已退出的直接結束。
+        """
+        pool = self.process_pool
+        if not pool: return
+        pool.reap()
+        now = time.time()
+        if now < self.next_pool_check: return
+        self.next_pool_check = now + POOL_CHECK_INTERVAL
+        latest = {}
+        for meta in self.games_meta.values():
+            info = meta["versions"].get(meta.get("latest_version"), {})
+            if info.get("blob") and info.get("manifest"): latest[info["blob"]] = info
+        for blob in set(pool.idle) | set(pool.launches):
+            keep = pool.target(blob, now) if blob in latest else 0
+            have = pool.shrink(blob, keep)
+            if have < keep and blob not in pool.spawning:
+                pool.spawning.add(blob)
+                # 與房間開局共用啟動 worker，但排在開局之後，尖峰時不會跟真正的開局搶資源
+                self.launch_executor.submit(LAUNCH_PRIORITY_PREWARM, self._prewarm_worker, blob, latest[blob], keep - have)
+
+    def _prewarm_worker(self, blob, info, count):
+        """在背景啟動 count 個 game server，各自有獨立的工作目錄與 port"""
+        entries = []
+        self.hold_tree(blob)
+        try:
+            tree = self.prepare_shared_tree(blob, info["path"])
+            for _ in range(count):
+                env_dir = os.path.join(RUN_ENV_DIR, f"pool_{next(self.pool_env_ids)}")
+                remove_tree(env_dir)
+                link_tree(tree, env_dir)
+                proc, port = self.spawn_game_server(info["manifest"], env_dir, os.path.basename(env_dir))
+                entries.append({"proc": proc, "port": port, "env_dir": env_dir, "started": time.time()})
+            return ("POOL_READY", {"blob": blob, "entries": entries})
+        except Exception as e:
+            return ("POOL_READY", {"blob": blob, "entries": entries, "msg": str(e)})
+        finally:
+            self.drop_tree(blob)
+
+    def on_pool_ready(self, result):
+        self.process_pool.spawning.discard(result["blob"])
+        self.process_pool.add(result["blob"], result["entries"])
+        if result.get("msg"): print(f"[!] Pre-warm failed for {result['blob'][:8]}: {result['msg']}")
+
+    def init_run_envs(self):
+        """啟動時清掉上次留下的房間目錄，以及已沒有對應 blob 的共用目錄"""
+        remove_tree(RUN_ENV_DIR)
+        os.makedirs(RUN_ENV_DIR, exist_ok=True)
+        if not os.path.exists(EXTRACT_DIR): os.makedirs(EXTRACT_DIR)
+        for name in os.listdir(EXTRACT_DIR):
+            if name not in self.blob_refs:
+                remove_tree(os.path.join(EXTRACT_DIR, name))
         
     # -------------------------------------------------
     #  Handlers: Plugin System
@@ -914,13 +2351,12 @@ class GameStoreServer:
         if "developer" not in data: data["developer"] = {}
         return data
 
-    def save_json(self, path, data):
-        temp = path + '.tmp'
-        try:
-            with open(temp, 'w') as f: json.dump(data, f, indent=4)
-            os.replace(temp, path)
-        except Exception as e:
-            print(f"[!] Save JSON error: {e}")
+    def migrate_json_db(self):
+        """將舊版的 users.json / games_meta.json 匯入 SQLite (原檔保留不動)"""
+        users = self.load_users_db()
+        games_meta = self.load_json(GAMES_META_DB)
+        if self.db.import_snapshot(users, games_meta) and (games_meta or users["player"] or users["developer"]):
+            print(f"[*] Migrated {len(games_meta)} games from JSON into {STORE_DB}")
 
     def signal_handler(self, signum, frame):
         print(f"\n[*] Caught signal {signum}, shutting down...")
@@ -934,19 +2370,34 @@ class GameStoreServer:
             return info["username"]
         return None
 
+    def room_of(self, username):
+        """玩家目前所在的房間 (不在任何房間時回傳 None)"""
+        return self.rooms.get(self.user_rooms.get(username))
+
+    def member_sockets(self, members):
+        """房間成員目前有效的 socket (透過 active_sessions 查找，被踢除的舊連線不會出現)"""
+        socks = []
+        for member in members:
+            s = self.active_sessions.get(("player", member))
+            if s is not None: socks.append(s)
+        return socks
+
+    def encode_for(self, sock, msg_type, payload):
+        """依該連線協商的能力編碼封包 (未協商的舊 Client 一律送原始格式)"""
+        # msg_type 為 None 代表 payload 已是編碼好的完整封包 (catalog cache)
+        if msg_type is None: return payload
+        caps = self.peer_caps.get(sock) or {}
+        return encode_packet(msg_type, payload, compress=bool(caps.get("compress")), encoding=caps.get("encoding"))
+
     def send_to(self, sock, msg_type, payload):
-        if sock not in self.inputs: return
         if sock in self.message_queues:
             self.message_queues[sock].put((msg_type, payload))
-            if sock not in self.outputs: self.outputs.append(sock)
+            self._watch_writable(sock, True)
 
     # 斷線處理更新
     def handle_disconnect(self, sock):
-        # 清理上傳狀態
-        if sock in self.upload_states:
-            try: self.upload_states[sock]["file_handle"].close()
-            except: pass
-            del self.upload_states[sock]
+        # 未完成的上傳先保留，讓 Client 重新連線後續傳
+        self._suspend_upload(sock)
             
         # 清理使用者 Session
         if sock in self.socket_map:
@@ -966,24 +2417,48 @@ class GameStoreServer:
 
             del self.socket_map[sock]
 
+        self.peer_caps.pop(sock, None)
+        self._close_connection(sock)
+
+    def _close_connection(self, sock):
         # 關閉 Socket
-        if sock in self.inputs: self.inputs.remove(sock)
-        if sock in self.outputs: self.outputs.remove(sock)
-        if sock in self.message_queues: del self.message_queues[sock]
+        try: self.selector.unregister(sock)
+        except (KeyError, ValueError): pass
+        if sock in self.message_queues: close_queued_streams(self.message_queues.pop(sock))
+        if sock in self.recv_buffers: del self.recv_buffers[sock]
+        if sock in self.send_buffers: del self.send_buffers[sock]
+        if sock in self.active_streams: self.active_streams.pop(sock).close()
         try: sock.close()
         except: pass
 
+    def run_periodic_tasks(self):
+        self.process_thread_results()
+        self.check_game_processes()
+        self.expire_suspended_uploads()
+        self.maintain_process_pool()
+
     def process_thread_results(self):
         while not self.thread_results.empty():
             try:
                 task_type, result = self.thread_results.get_nowait()
-                if task_type == "GAME_LAUNCH_SUCCESS":
-                    self.on_game_launched(result)
-                elif task_type == "GAME_LAUNCH_FAIL":
-                    self.on_game_launch_failed(result)
+                self.dispatch_thread_result(task_type, result)
             except queue.Empty:
                 break
 
+    def dispatch_thread_result(self, task_type, result):
+        if task_type == "GAME_LAUNCH_SUCCESS":
+            self.on_game_launched(result)
+        elif task_type == "GAME_LAUNCH_FAIL":
+            self.on_game_launch_failed(result)
+        elif task_type == "DELTA_READY":
+            self.on_delta_ready(result)
+        elif task_type == "DELTA_FAIL":
+            self.on_delta_failed(result)
+        elif task_type == "POOL_READY":
+            self.on_pool_ready(result)
+        elif task_type == "ARCHIVE_LOADED":
+            self.archive_cache.put(result["path"], result["data"])
+
     def check_game_processes(self):
         finished_rooms = []
         for rid, proc in self.running_games.items():
@@ -994,6 +2469,8 @@ class GameStoreServer:
             exit_code = self.running_games[rid].returncode
             print(f"[*] Room {rid} Game Server finished (Exit Code: {exit_code})")
             del self.running_games[rid]
+            remove_tree(self.room_envs.pop(rid, self.room_env_path(rid)))
+            if rid in self.room_ports: self.port_allocator.release(self.room_ports.pop(rid))
             if rid in self.rooms:
                 self.rooms[rid]["status"] = "WAITING"
                 self.broadcast_room_status(rid)
@@ -1008,22 +2485,209 @@ class GameStoreServer:
                     except subprocess.TimeoutExpired: proc.kill()
             except: pass
         self.running_games.clear()
-        for s in self.inputs:
-            try: s.close()
+        self.launch_executor.close()
+        if self.process_pool: self.process_pool.close()
+        # 續傳狀態只存在記憶體中，重啟後無法接續，暫存檔一併清掉
+        for state in list(self.upload_states.values()) + list(self.suspended_uploads.values()):
+            self._discard_upload(state)
+        self.upload_states.clear(); self.suspended_uploads.clear()
+        for key in list((self.selector.get_map() or {}).values()):
+            try: key.fileobj.close()
             except: pass
+        if self.wakeup_w: self.wakeup_w.close()
+        if not self.db_writer.stopping:
+            self.db_writer.close()
+            print(f"[*] DB writer stats: {self.db_writer.stats()}")
+            print(f"[*] Archive cache stats: {self.archive_cache.stats()}")
+            if self.process_pool: print(f"[*] Process pool stats: {self.process_pool.stats()}")
+            print(f"[*] Port leases: {self.port_allocator.stats()}")
+            print(f"[*] Launch executor stats: {self.launch_executor.stats()}")
+        self.db.close()
 
     def broadcast_room_status(self, room_id):
         if room_id not in self.rooms: return
         room = self.rooms[room_id]
         packet = {"room": room}
-        # 廣播給房間內的所有成員 (需透過 socket_map 查找 socket)
-        # 這裡需要反向查找: 哪些 socket 的 username 在 room['members'] 裡
-        # 效率較低但功能正確的寫法:
-        for s, info in list(self.socket_map.items()):
-            if info["role"] == "player" and info["username"] in room["members"]:
-                self.send_to(s, MSG_ROOM_STATUS_UPDATE, packet)
-
-                  
+        for s in self.member_sockets(room["members"]):
+            self.send_to(s, MSG_ROOM_STATUS_UPDATE, packet)
+
+
+# ==========================================
+#  asyncio Runtime
+# ==========================================
+ASYNC_MAINTENANCE_INTERVAL = 0.5   # 檢查子行程等週期性工作的間隔 (秒)
+# 這些封包的 handler 只做該連線的檔案 I/O，交給 executor 執行 (共用狀態的變更由 handler 內的 lock 保護)
+ASYNC_OFFLOAD_TYPES = {MSG_GAME_UPLOAD_DATA}
+
+class AsyncConnection:
+    """asyncio 模式下的一條 Client 連線，取代 socket 作為各 handler 的 key"""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+
+    def fileno(self):
+        sock = self.writer.get_extra_info("socket")
+        return sock.fileno() if sock else -1
+
+    def close(self):
+        self.writer.close()
+
+    def __repr__(self):
+        return f"<AsyncConnection {self.addr}>"
+
+class AsyncGameStoreServer(GameStoreServer):
+    """
+    以 asyncio streams 實作的 Server 執行模式。
+    每條連線一個讀取 coroutine + 一個寫出 coroutine，沿用 GameStoreServer 的所有 handle_*；
+    背景工作 (啟動遊戲、上傳寫檔) 透過 run_in_executor 執行，完成時直接回到 event loop 處理。
+    """
+    def __init__(self, prewarm=False):
+        super().__init__(prewarm)
+        self.loop = None
+        self.loop_thread = None
+
+    def start(self):
+        self._open_listen_socket()
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            print("\n[*] Server stopping...")
+        self.cleanup_server()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        server = await asyncio.start_server(self._serve_connection, sock=self.server_socket)
+        maintenance = asyncio.create_task(self._maintenance_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            maintenance.cancel()
+
+    async def _maintenance_loop(self):
+        while True:
+            try:
+                self.run_periodic_tasks()
+            except Exception as e:
+                print(f"[!] Maintenance Error: {e}")
+                traceback.print_exc()
+            await asyncio.sleep(ASYNC_MAINTENANCE_INTERVAL)
+
+    async def _serve_connection(self, reader, writer):
+        conn = AsyncConnection(reader, writer)
+        self.message_queues[conn] = asyncio.Queue()
+        print(f"[+] New connection from {conn.addr}")
+        writer_task = asyncio.create_task(self._writer_loop(conn, self.message_queues[conn]))
+        try:
+            while conn in self.message_queues:
+                msg_type, payload = await async_recv_packet(reader)
+                if msg_type is None: break
+                if msg_type in ASYNC_OFFLOAD_TYPES:
+                    # 等待 executor 完成才讀下一個封包，維持同一連線的處理順序
+                    await self.loop.run_in_executor(None, self.handle_packet, conn, msg_type, payload)
+                else:
+                    self.handle_packet(conn, msg_type, payload)
+        except Exception as e:
+            print(f"[!] Error processing packet: {e}")
+        finally:
+            self.handle_disconnect(conn)
+            await writer_task
+
+    async def _writer_loop(self, conn, q):
+        """將送出佇列的封包合併寫出，drain() 提供背壓；收到 None 代表連線結束"""
+        try:
+            while True:
+                item = await q.get()
+                if item is None: break
+                buf = bytearray()
+                while True:
+                    msg_type, payload = item
+                    if isinstance(payload, DownloadStream):
+                        if buf:
+                            conn.writer.write(buf)
+                            buf = bytearray()
+                        await self._send_stream(conn, payload)
+                    else:
+                        frame = self.encode_for(conn, msg_type, payload)
+                        if frame: buf += frame
+                    if len(buf) >= SEND_BUFFER_LIMIT or q.empty(): break
+                    item = q.get_nowait()
+                    if item is None: break
+                if buf:
+                    conn.writer.write(buf)
+                    await conn.writer.drain()
+                if item is None: break
+        except (ConnectionError, OSError, RuntimeError) as e:
+            # RuntimeError: loop.sendfile 在 transport 已關閉時拋出 "Transport is closing"
+            print(f"[!] Write failed for {conn.addr}: {e}")
+        finally:
+            close_queued_streams(q)
+            conn.close()
+
+    async def _send_stream(self, conn, stream):
+        # loop.sendfile 會先等 transport 緩衝區送完，再以 os.sendfile 送出檔案內容
+        try:
+            while not stream.done():
+                conn.writer.write(stream.next_header())
+                if stream.buffer is not None:
+                    # 快取中的內容：寫入共用 buffer 的切片，等 transport 消化後再送下一段
+                    count = stream.frame_remaining
+                    conn.writer.write(stream.payload_view())
+                    await conn.writer.drain()
+                else:
+                    f, offset, count = stream.payload_span()
+                    await self.loop.sendfile(conn.writer.transport, f, offset, count)
+                stream.advance(count)
+        finally:
+            stream.close()
+
+    def _in_loop_thread(self):
+        return threading.get_ident() == self.loop_thread
+
+    def send_to(self, sock, msg_type, payload):
+        # 從 executor 執行緒呼叫時轉回 event loop，asyncio.Queue 不是 thread-safe
+        if not self._in_loop_thread():
+            self.loop.call_soon_threadsafe(self.send_to, sock, msg_type, payload)
+            return
+        if sock in self.message_queues:
+            self.message_queues[sock].put_nowait((msg_type, payload))
+
+    def handle_disconnect(self, sock):
+        if not self._in_loop_thread():
+            self.loop.call_soon_threadsafe(self.handle_disconnect, sock)
+            return
+        super().handle_disconnect(sock)
+
+    def _close_connection(self, sock):
+        # 放入 None 讓 writer 送完剩餘封包後關閉連線
+        q = self.message_queues.pop(sock, None)
+        if q is not None: q.put_nowait(None)
+
+    def run_in_background(self, func, *args):
+        future = self.loop.run_in_executor(None, func, *args)
+        future.add_done_callback(self._on_background_done)
+
+    def post_result(self, task_type, result):
+        try:
+            self.loop.call_soon_threadsafe(self.dispatch_thread_result, task_type, result)
+        except RuntimeError:
+            pass   # event loop 已關閉 (關機中)
+
+    def _on_background_done(self, future):
+        try:
+            task_type, result = future.result()
+            self.dispatch_thread_result(task_type, result)
+        except Exception as e:
+            print(f"[!] Background task error: {e}")
+
+    def cleanup_server(self):
+        super().cleanup_server()
+        for conn in list(self.message_queues):
+            try: conn.close()
+            except: pass
+
 # [Spec PL] 內建的聊天室 Plugin 程式碼 (Client 端執行)
 CHAT_PLUGIN_CODE = r"""
 import tkinter as tk
@@ -1118,5 +2782,11 @@ class RoomChat:
 """
 
 if __name__ == "__main__":
-    server = GameStoreServer()
+    # python server_main.py --async 以 asyncio 模式啟動
+    # --prewarm 為熱門遊戲預先啟動 game server 行程
+    prewarm = "--prewarm" in sys.argv[1:]
+    if "--async" in sys.argv[1:]:
+        server = AsyncGameStoreServer(prewarm)
+    else:
+        server = GameStoreServer(prewarm)
     server.start()
\ No newline at end of file
@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import zipfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+from server_main import parse_game_manifest
+
+
+class ParseManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def archive(self, manifest):
+        path = os.path.join(self.tmp, "game.zip")
+        with zipfile.ZipFile(path, 'w') as z: z.writestr("manifest.json", json.dumps(manifest))
+        return path
+
+    def test_client_cmd_is_optional(self):
+        m = parse_game_manifest(self.archive({"execution": {"server_cmd": ["python3", "server.py"]}}), "1.0")
+        self.assertEqual(m["execution"]["server_cmd"], ["python3", "server.py"])
+        self.assertNotIn("client_cmd", m["execution"])
+
+    def test_numeric_version_matches(self):
+        path = self.archive({"version": 1.0, "execution": {"server_cmd": ["s"]}})
+        parse_game_manifest(path, "1.0")
+        parse_game_manifest(path, 1.0)
+        with self.assertRaises(ValueError): parse_game_manifest(path, "2.0")
+
+    def test_lenient_parse_only_needs_server_cmd(self):
+        # 驗證規則出現前上架的版本：版本不符、人數格式錯誤都不影響開局
+        path = self.archive({"version": "0.9", "min_players": "two", "execution": {"server_cmd": ["s"], "client_cmd": "c"}})
+        with self.assertRaises(ValueError): parse_game_manifest(path, "1.0")
+        m = parse_game_manifest(path, "1.0", strict=False)
+        self.assertEqual(m, {"execution": {"server_cmd": ["s"], "args_format": {}}})
+        with self.assertRaises(ValueError): parse_game_manifest(self.archive({"execution": {}}), "1.0", strict=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'server'))
+from server_main import GameStoreDB
+
+
+def game(gid, version="1.0", reviews=()):
+    return {
+        "id": gid, "owner": "dev", "description": "d", "type": "CLI",
+        "min_players": 2, "max_players": 2, "latest_version": version,
+        "versions": {version: {"checksum": "c", "path": "p"}},
+        "reviews": [{"user": "u", "score": s, "comment": "", "time": 0} for s in reviews],
+        "played_by": ["u"] if reviews else [],
+    }
+
+
+class JsonMigrationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = GameStoreDB(os.path.join(self.tmp, "data", "store.db"))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_duplicate_ids_keep_every_game(self):
+        # 舊版以 len(games_meta) + 1 配發 id：下架一款後再上架，新遊戲會拿到與現有遊戲相同的 id
+        games_meta = {"A": game(1), "B": game(2, reviews=(5, 3)), "C": game(2)}
+        self.assertTrue(self.db.import_snapshot({"player": {}, "developer": {}}, games_meta))
+
+        games = self.db.load_games()
+        self.assertEqual(sorted(games), ["A", "B", "C"])
+        ids = [games[n]["id"] for n in ("A", "B", "C")]
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual(games["B"]["rating_count"], 2)
+        self.assertEqual(games["B"]["played_by"], {"u"})
+        self.assertIn("1.0", games["C"]["versions"])
+
+    def test_missing_id_gets_fresh_id(self):
+        games_meta = {"A": game(3), "B": game(None)}
+        self.assertTrue(self.db.import_snapshot({"player": {}, "developer": {}}, games_meta))
+        games = self.db.load_games()
+        self.assertEqual((games["A"]["id"], games["B"]["id"]), (3, 4))
+
+    def test_import_does_not_replace_on_collision(self):
+        # 匯入路徑使用單純的 INSERT：就算 id 仍然衝突也是整批失敗，不會刪掉已存在的遊戲
+        self.assertTrue(self.db.execute(self.db.game_ops("A", game(1))))
+        self.assertFalse(self.db.execute(self.db.game_ops("B", game(1), replace=False)))
+        self.assertEqual(sorted(self.db.load_games()), ["A"])
+
+
+if __name__ == "__main__":
+    unittest.main()